@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class MinesweeperConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'minesweeper'
+
+    def ready(self):
+        from minesweeper.common.instrumentation import install_query_recorder
+
+        install_query_recorder()
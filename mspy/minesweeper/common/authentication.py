@@ -0,0 +1,58 @@
+import hashlib
+from time import time
+from typing import Any, Dict, Optional
+
+from django.http import HttpRequest
+from django.utils.deprecation import MiddlewareMixin
+from imagination import container
+from jwt import InvalidTokenError
+
+from minesweeper.common.lru_cache import LRUCache
+from minesweeper.common.token_service import TokenService
+
+VERIFIED_TOKEN_CACHE_SIZE = 1024
+
+token_service: TokenService = container.get(TokenService)
+
+# The claims of the already verified tokens, keyed by the SHA-256 digest of the token, evicted when the token expires.
+_verified_claims: LRUCache[Dict[str, Any]] = LRUCache(VERIFIED_TOKEN_CACHE_SIZE)
+
+
+def decode_token(token: str) -> Optional[Dict[str, Any]]:
+    """ Decode and verify the token, or return None if the token is invalid or expired """
+    key = hashlib.sha256(token.encode()).digest()
+    claims = _verified_claims.get(key)
+
+    if claims is not None:
+        return claims
+
+    try:
+        claims = token_service.decode_token(token)
+    except InvalidTokenError:
+        return None
+
+    ttl = claims['exp'] - time() if 'exp' in claims else None
+
+    if ttl is None or ttl > 0:
+        _verified_claims.put(key, claims, ttl=ttl)
+
+    return claims
+
+
+def decode_authorization_header(request: HttpRequest) -> Optional[Dict[str, Any]]:
+    bearer_token = request.headers.get('authorization')
+
+    if not bearer_token:
+        return None
+    else:
+        return decode_token(bearer_token[7:])
+
+
+class BearerTokenAuthenticationMiddleware(MiddlewareMixin):
+    """ Decode the bearer token once per request and attach its claims to the request as "token_claims".
+
+        The claims are None if the token is missing, invalid or expired.
+    """
+
+    def process_request(self, request: HttpRequest):
+        request.token_claims = decode_authorization_header(request)
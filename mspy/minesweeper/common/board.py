@@ -0,0 +1,218 @@
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# Each square is packed into one byte:
+#
+#   bit 0-3: the number of nearby mines (0-8)
+#   bit 4:   the mine flag
+#   bit 5-7: the state code of the square (see STATE_CODES)
+NEARBY_MINE_COUNT_MASK = 0b00001111
+MINE_MASK = 0b00010000
+STATE_SHIFT = 5
+STATE_MASK = 0b11100000
+
+UNTOUCHED_CODE = 0
+
+# NOTE: The names must be kept in sync with the move states in minesweeper.common.board_engine.
+STATE_CODES = {
+    'unknown': 1,  # Touched by the player but without any known state, e.g., unflagged.
+    'cleared': 2,
+    'flagged': 3,
+    'exploded': 4,
+}
+
+STATE_NAMES = {code: name for name, code in STATE_CODES.items()}
+
+
+class Board:
+    """ Compact board representation
+
+        All squares are stored in one bytearray, indexed by "y * width + x".
+    """
+
+    def __init__(self, width: int, height: int, cells: Optional[bytearray] = None):
+        self._width = width
+        self._height = height
+        self._cells = cells if cells is not None else bytearray(width * height)
+
+    @property
+    def width(self) -> int:
+        return self._width
+
+    @property
+    def height(self) -> int:
+        return self._height
+
+    @property
+    def cells(self) -> bytearray:
+        return self._cells
+
+    @property
+    def size(self) -> int:
+        return len(self._cells)
+
+    def index(self, x: int, y: int) -> int:
+        return y * self._width + x
+
+    def coordinate(self, index: int) -> Tuple[int, int]:
+        y, x = divmod(index, self._width)
+        return x, y
+
+    def contains(self, x: int, y: int) -> bool:
+        return 0 <= x < self._width and 0 <= y < self._height
+
+    def get_neighbours(self, index: int) -> List[int]:
+        """ Get the indexes of the (up to eight) surrounding squares """
+        row, column = divmod(index, self._width)
+        return [
+            y * self._width + x
+            for y in range(max(0, row - 1), min(self._height, row + 2))
+            for x in range(max(0, column - 1), min(self._width, column + 2))
+            if y != row or x != column
+        ]
+
+    def is_mine(self, index: int) -> bool:
+        return bool(self._cells[index] & MINE_MASK)
+
+    def get_nearby_mine_count(self, index: int) -> int:
+        return self._cells[index] & NEARBY_MINE_COUNT_MASK
+
+    def get_state_code(self, index: int) -> int:
+        return self._cells[index] >> STATE_SHIFT
+
+    def get_state(self, index: int) -> Optional[str]:
+        """ Get the state name of the square or None if the square is never touched. """
+        return STATE_NAMES.get(self._cells[index] >> STATE_SHIFT)
+
+    def set_state(self, index: int, state: str):
+        self._cells[index] = (self._cells[index] & ~STATE_MASK & 0xFF) | (STATE_CODES[state] << STATE_SHIFT)
+
+    def set_states(self, indexes: Iterable[int], state: str):
+        """ Set the same state on all given squares in one pass """
+        cells = self._cells
+        state_bits = STATE_CODES[state] << STATE_SHIFT
+        kept_mask = ~STATE_MASK & 0xFF
+
+        for index in indexes:
+            cells[index] = (cells[index] & kept_mask) | state_bits
+
+    def iterate_touched_squares(self) -> Iterator[Tuple[int, str]]:
+        """ Iterate over (index, state name) of all squares touched by the player. """
+        for index, cell in enumerate(self._cells):
+            if cell & STATE_MASK:
+                yield index, STATE_NAMES[cell >> STATE_SHIFT]
+
+    def get_mine_indexes(self) -> List[int]:
+        return [index for index, cell in enumerate(self._cells) if cell & MINE_MASK]
+
+    def get_nearby_mine_counts(self) -> bytes:
+        """ Get the nearby mine count of all squares, one byte per square """
+        return self._cells.translate(_NEARBY_MINE_COUNT_TABLE)
+
+    def get_state_codes(self) -> bytes:
+        """ Get the state code of all squares, one byte per square """
+        return self._cells.translate(_STATE_CODE_TABLE)
+
+    def get_nearby_mine_count_matrix(self) -> List[List[int]]:
+        """ Get the row-to-column matrix of the nearby mine count, i.e., array<row, column> """
+        counts = self.get_nearby_mine_counts()
+        return [
+            list(counts[y * self._width:(y + 1) * self._width])
+            for y in range(self._height)
+        ]
+
+    @classmethod
+    def make(cls, width: int, height: int, mine_positions: Iterable[Tuple[int, int]]):
+        """ Make a new board with the given mine positions, all squares are untouched. """
+        mine_flags = bytearray(width * height)
+
+        for x, y in mine_positions:
+            mine_flags[y * width + x] = 1
+
+        return cls.assemble(width, height, mine_flags, compute_nearby_mine_counts(width, height, mine_flags))
+
+    @classmethod
+    def assemble(cls, width: int, height: int, mine_flags: bytes, nearby_mine_counts: bytes,
+                 state_codes: Optional[bytes] = None):
+        """ Assemble a new board from the mine flags, the nearby mine counts and optionally the state codes (one byte
+            per square for all of them).
+        """
+        size = width * height
+        mine_bits = int.from_bytes(mine_flags.translate(_MINE_FLAG_TO_MASK_TABLE), 'little')
+        cells = int.from_bytes(nearby_mine_counts, 'little') | mine_bits
+
+        if state_codes is not None:
+            cells |= int.from_bytes(state_codes.translate(_STATE_CODE_TO_BITS_TABLE), 'little')
+
+        return cls(width, height, bytearray(cells.to_bytes(size, 'little')))
+
+
+def compute_nearby_mine_counts(width: int, height: int, mine_flags: bytes) -> bytes:
+    """ Compute the number of nearby mines of every square (one byte per square, indexed by "y * width + x").
+
+        The mine flags must have one byte per square, 1 for a mine and 0 otherwise. The whole board is computed at
+        once as a 3x3 box-sum convolution over one big integer where each byte is one square. As a sum never exceeds
+        9, no byte ever carries into the next one. The mine squares always have no hint.
+    """
+    size = width * height
+
+    if size == 0:
+        return b''
+
+    byte_mask = (1 << (8 * size)) - 1
+    mines = int.from_bytes(mine_flags, 'little')
+
+    # Mask out the squares that would receive the value from the previous or the next row.
+    first_column = bytearray(b'\xff') * size
+    first_column[::width] = bytes(height)
+    last_column = bytearray(b'\xff') * size
+    last_column[width - 1::width] = bytes(height)
+
+    horizontal_sums = mines \
+        + ((mines << 8) & int.from_bytes(first_column, 'little')) \
+        + ((mines >> 8) & int.from_bytes(last_column, 'little'))
+    row_shift = 8 * width
+    box_sums = horizontal_sums \
+        + ((horizontal_sums << row_shift) & byte_mask) \
+        + (horizontal_sums >> row_shift)
+
+    # Clear the counts of the mine squares.
+    safe_mask = int.from_bytes(mine_flags.translate(_MINE_FLAG_TO_SAFE_MASK_TABLE), 'little')
+
+    return (box_sums & safe_mask).to_bytes(size, 'little')
+
+
+def pack_bits(flags: bytes) -> bytes:
+    """ Pack the flags (one byte per square, 0 or 1) into a bitset.
+
+        The flag of the square at index i is stored in the bit (i % 8) of the byte (i // 8), the least significant bit
+        first. The bytes are packed one bit position at a time with the byte translation, instead of per square.
+    """
+    size = len(flags)
+    padded_flags = flags + bytes(-size % 8)
+    bitset = 0
+
+    for bit in range(8):
+        bitset |= int.from_bytes(padded_flags[bit::8].translate(_FLAG_TO_BIT_TABLES[bit]), 'little')
+
+    return bitset.to_bytes(len(padded_flags) // 8, 'little')
+
+
+def unpack_bits(bitset: bytes, size: int) -> bytearray:
+    """ Unpack the bitset into the flags, one byte per square (0 or 1). See pack_bits. """
+    flags = bytearray(len(bitset) * 8)
+
+    for bit in range(8):
+        flags[bit::8] = bitset.translate(_BIT_TO_FLAG_TABLES[bit])
+
+    del flags[size:]
+
+    return flags
+
+
+_FLAG_TO_BIT_TABLES = [bytes((1 << bit) if value else 0 for value in range(256)) for bit in range(8)]
+_BIT_TO_FLAG_TABLES = [bytes((value >> bit) & 1 for value in range(256)) for bit in range(8)]
+_NEARBY_MINE_COUNT_TABLE = bytes(value & NEARBY_MINE_COUNT_MASK for value in range(256))
+_STATE_CODE_TABLE = bytes(value >> STATE_SHIFT for value in range(256))
+_STATE_CODE_TO_BITS_TABLE = bytes((value << STATE_SHIFT) & STATE_MASK for value in range(256))
+_MINE_FLAG_TO_MASK_TABLE = bytes(MINE_MASK if value else 0 for value in range(256))
+_MINE_FLAG_TO_SAFE_MASK_TABLE = bytes(0 if value else 0xFF for value in range(256))
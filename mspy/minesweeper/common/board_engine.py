@@ -0,0 +1,107 @@
+from itertools import repeat
+from typing import List, Optional, Set, Tuple
+
+from minesweeper.common.board import Board
+from minesweeper.common.reveal_engine import get_chord_targets, reveal_area
+
+ACTIVE = 'active'
+CLEARED = 'cleared'
+EXPLODED = 'exploded'
+FLAGGED = 'flagged'
+UNKNOWN = 'unknown'
+CHORD = 'chord'  # Not a state, but the move to reveal all unflagged squares around a satisfied number.
+
+KNOWN_STATES = [
+    CLEARED,
+    EXPLODED,
+    FLAGGED,
+]
+
+
+class BoardEngine:
+    """ The rules of the game, independent of the persistence
+
+        The engine applies the moves on the board and keeps the running counters up to date, so that the state of the
+        game is evaluated in constant time.
+    """
+
+    def __init__(self,
+                 board: Board,
+                 revealed_safe_count: int = 0,
+                 correct_flag_count: int = 0,
+                 wrong_flag_count: int = 0,
+                 exploded: bool = False):
+        self._board = board
+        self.revealed_safe_count = revealed_safe_count
+        self.correct_flag_count = correct_flag_count
+        self.wrong_flag_count = wrong_flag_count
+        self.exploded = exploded
+        self.changed_indexes: Set[int] = set()
+
+    @property
+    def board(self) -> Board:
+        return self._board
+
+    def apply(self, index: int, action: Optional[str]) -> List[Tuple[int, str]]:
+        """ Apply one move on the square, i.e., flag, unflag ("unknown"), chord or reveal (any other action).
+
+            Returns the moves to record as (index, state), in order.
+        """
+        if action == FLAGGED or action == UNKNOWN:
+            self.change_state(index, action)
+            return [(index, action)]
+        elif action == CHORD:
+            recorded_moves: List[Tuple[int, str]] = []
+
+            for target in get_chord_targets(self._board, index):
+                recorded_moves.extend(self.reveal(target))
+                if self.exploded:
+                    break
+
+            return recorded_moves
+        else:
+            return self.reveal(index)
+
+    def reveal(self, index: int) -> List[Tuple[int, str]]:
+        if self._board.is_mine(index):
+            self.change_state(index, EXPLODED)
+            return [(index, EXPLODED)]
+
+        revealed_indexes = reveal_area(self._board, index)
+
+        # NOTE: The flood never reveals a cleared, flagged or exploded square, so only the revealed safe count changes.
+        self._board.set_states(revealed_indexes, CLEARED)
+        self.revealed_safe_count += len(revealed_indexes)
+        self.changed_indexes.update(revealed_indexes)
+
+        return list(zip(revealed_indexes, repeat(CLEARED)))
+
+    def change_state(self, index: int, state: str):
+        """ Change the state of one square and keep the running counters up to date """
+        self._count_state(index, self._board.get_state(index), -1)
+        self._board.set_state(index, state)
+        self._count_state(index, state, 1)
+        self.changed_indexes.add(index)
+
+    def _count_state(self, index: int, state: Optional[str], delta: int):
+        if state == CLEARED:
+            self.revealed_safe_count += delta
+        elif state == FLAGGED:
+            if self._board.is_mine(index):
+                self.correct_flag_count += delta
+            else:
+                self.wrong_flag_count += delta
+        elif state == EXPLODED:
+            self.exploded = delta > 0
+
+    def evaluate(self) -> str:
+        if self.exploded:
+            return EXPLODED
+
+        # NOTE: A wrongly flagged square counts as a cleared one.
+        known_square_count = self.revealed_safe_count + self.correct_flag_count + self.wrong_flag_count
+
+        if known_square_count == self._board.size:
+            return CLEARED
+        else:
+            return ACTIVE
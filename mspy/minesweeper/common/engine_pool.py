@@ -0,0 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+from minesweeper.common.profiling import profile_segment
+
+ENGINE_THREAD_COUNT = 8  # The number of threads per process for the CPU-heavy (and blocking) engine work
+
+T = TypeVar('T')
+
+_executor = ThreadPoolExecutor(max_workers=ENGINE_THREAD_COUNT, thread_name_prefix='engine')
+
+
+def _run_with_fresh_connection(func: Callable[..., T], *args, **kwargs) -> T:
+    # The engine threads outlive the requests, so their database connections are recycled like the ones of a request.
+    close_old_connections()
+    try:
+        with profile_segment():
+            return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_engine_pool(func: Callable[..., T], *args, **kwargs) -> T:
+    """ Run the function in the engine thread pool without blocking the event loop.
+
+        The function may use the synchronous ORM, e.g., in a transaction. The context variables are propagated, and the
+        function is profiled as a part of the current request, if profiled.
+    """
+    return await sync_to_async(_run_with_fresh_connection, thread_sensitive=False, executor=_executor)(func,
+                                                                                                       *args,
+                                                                                                       **kwargs)
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+import os
+import select
+from threading import Lock, Thread
+from time import sleep
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+from django.db import connection, connections
+from django.utils.module_loading import import_string
+from imagination.decorator.service import Service
+
+SUBSCRIBER_QUEUE_SIZE = 64  # The number of undelivered events before a subscriber is told to resync
+KEEPALIVE_INTERVAL = 15  # in seconds
+MAX_NOTIFY_PAYLOAD_SIZE = 7900  # PostgreSQL rejects a NOTIFY payload of 8000 bytes or more.
+
+# Sent instead of the events that a subscriber missed, e.g., when it is too slow. The client must fetch the snapshot.
+RESYNC_EVENT = 'event: resync\ndata: {}\n\n'
+
+logger = logging.getLogger(__name__)
+
+
+def format_event(event: str, data: str, id: Optional[int] = None) -> str:
+    """ Format one server-sent event, where the data is a single line of JSON """
+    if id is None:
+        return f'event: {event}\ndata: {data}\n\n'
+    else:
+        return f'id: {id}\nevent: {event}\ndata: {data}\n\n'
+
+
+class LocalBroker:
+    """ Fan out the events to the subscribers of this process only
+
+        The events are published from any thread, e.g., the engine thread pool, and delivered to the event loop of each
+        subscriber. Each event is formatted once, whatever the number of subscribers.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = dict()
+        self._lock = Lock()
+
+    def publish(self, topic: str, message: str):
+        self._deliver(topic, message)
+
+    def _deliver(self, topic: str, message: str):
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, message)
+            except RuntimeError:
+                pass  # The event loop is closed, i.e., the subscriber is gone.
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, message: str):
+        if queue.full():
+            # The subscriber is too slow. Drop the backlog as the client has to fetch the snapshot anyway.
+            while not queue.empty():
+                queue.get_nowait()
+            message = RESYNC_EVENT
+
+        queue.put_nowait(message)
+
+    async def subscribe(self, topic: str) -> AsyncIterator[str]:
+        """ Yield the messages published to the topic, or a comment line as a keepalive if there is none for a while
+
+            The first message is a comment line, yielded once subscribed.
+        """
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(SUBSCRIBER_QUEUE_SIZE))
+
+        with self._lock:
+            self._subscribers.setdefault(topic, set()).add(subscriber)
+
+        try:
+            yield ': subscribed\n\n'
+
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber[1].get(), KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+        finally:
+            with self._lock:
+                self._subscribers[topic].discard(subscriber)
+                if not self._subscribers[topic]:
+                    del self._subscribers[topic]
+
+
+class PostgresBroker(LocalBroker):
+    """ Fan out the events to the subscribers of every process with LISTEN/NOTIFY
+
+        The notifications are only sent when the transaction is committed. One listener thread per process, started on
+        the first subscription, delivers them to the local subscribers.
+    """
+    CHANNEL = 'minesweeper_game_events'
+
+    def __init__(self):
+        super().__init__()
+        self._listener: Optional[Thread] = None
+
+    def publish(self, topic: str, message: str):
+        payload = json.dumps([topic, message])
+
+        if len(payload.encode()) > MAX_NOTIFY_PAYLOAD_SIZE:
+            payload = json.dumps([topic, RESYNC_EVENT])
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.CHANNEL, payload])
+
+    def subscribe(self, topic: str) -> AsyncIterator[str]:
+        with self._lock:
+            if self._listener is None:
+                self._listener = Thread(target=self._listen, name='game-event-listener', daemon=True)
+                self._listener.start()
+
+        return super().subscribe(topic)
+
+    def _listen(self):
+        while True:
+            listener_connection = None
+
+            try:
+                database = connections['default']
+                listener_connection = database.get_new_connection(database.get_connection_params())
+                listener_connection.autocommit = True
+
+                with listener_connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.CHANNEL}')
+
+                while True:
+                    if select.select([listener_connection], [], [], KEEPALIVE_INTERVAL) == ([], [], []):
+                        continue
+
+                    listener_connection.poll()
+
+                    while listener_connection.notifies:
+                        notification = listener_connection.notifies.pop(0)
+                        topic, message = json.loads(notification.payload)
+                        self._deliver(topic, message)
+            except Exception:
+                logger.exception('Lost the connection for the game events. Reconnecting...')
+
+                if listener_connection is not None:
+                    listener_connection.close()
+
+                sleep(1)
+
+
+_BACKENDS = {
+    'local': LocalBroker,
+    'postgres': PostgresBroker,
+}
+
+
+@Service()
+class GameEventBroker:
+    """ The broker of the game events, chosen by the GAME_EVENT_BROKER environment variable
+
+        It is either "local" (default, for a single process), "postgres" (for multiple processes) or the dotted path of
+        a class with the same interface as LocalBroker.
+    """
+
+    def __init__(self):
+        backend_name = os.environ.get('GAME_EVENT_BROKER') or 'local'
+        backend_cls = _BACKENDS[backend_name] if backend_name in _BACKENDS else import_string(backend_name)
+        self._backend = backend_cls()
+
+    def publish(self, topic: str, message: str):
+        self._backend.publish(topic, message)
+
+    def subscribe(self, topic: str) -> AsyncIterator[str]:
+        return self._backend.subscribe(topic)
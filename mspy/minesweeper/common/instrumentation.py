@@ -0,0 +1,239 @@
+import hmac
+import os
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+
+# The phases measured in each request, besides the database, in the order of the Server-Timing header
+PHASES = ['load', 'moves', 'engine', 'hints', 'serialize']
+
+TIME_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]  # in seconds
+QUERY_COUNT_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 500]
+PAYLOAD_SIZE_BUCKETS = [256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216]  # in bytes
+
+
+class RequestTimings:
+    """ The time spent by one request in each phase, including the time spent in the other threads for the request """
+
+    def __init__(self):
+        self.durations: Dict[str, float] = dict()
+        self.query_count = 0
+        self._lock = Lock()
+
+    def add(self, phase: str, duration: float):
+        with self._lock:
+            self.durations[phase] = self.durations.get(phase, 0) + duration
+
+    def add_query(self, duration: float):
+        with self._lock:
+            self.query_count += 1
+            self.durations['db'] = self.durations.get('db', 0) + duration
+
+
+# The timings of the current request, propagated to the engine thread pool and the ORM threads
+_current_timings: ContextVar[Optional[RequestTimings]] = ContextVar('request_timings', default=None)
+
+
+@contextmanager
+def measure(phase: str):
+    """ Add the time spent in the block to the phase of the current request, if any """
+    timings = _current_timings.get()
+
+    if timings is None:
+        yield
+        return
+
+    start_time = perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, perf_counter() - start_time)
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = _current_timings.get()
+
+    if timings is None:
+        return execute(sql, params, many, context)
+
+    start_time = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add_query(perf_counter() - start_time)
+
+
+def _install_query_recorder(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def install_query_recorder():
+    """ Record the queries of every database connection, including the ones already created by this thread """
+    connection_created.connect(_install_query_recorder)
+
+    for connection in connections.all(initialized_only=True):
+        _install_query_recorder(None, connection)
+
+
+class Histogram:
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is for "+Inf".
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class MetricRegistry:
+    """ The histograms of the requests of this process, per route and method """
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, str, str], Histogram] = dict()
+        self._lock = Lock()
+
+    def observe(self, metric: str, route: str, method: str, value: float, buckets: List[float]):
+        with self._lock:
+            key = (metric, route, method)
+            histogram = self._histograms.get(key)
+
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+
+            histogram.observe(value)
+
+    def render(self) -> str:
+        """ Render the histograms in the Prometheus text format """
+        lines: List[str] = []
+        last_metric = None
+
+        with self._lock:
+            for (metric, route, method), histogram in sorted(self._histograms.items()):
+                if metric != last_metric:
+                    lines.append(f'# TYPE {metric} histogram')
+                    last_metric = metric
+
+                labels = f'route="{route}",method="{method}"'
+                cumulative_count = 0
+
+                for bucket, count in zip([*histogram.buckets, '+Inf'], histogram.counts):
+                    cumulative_count += count
+                    lines.append(f'{metric}_bucket{{{labels},le="{bucket}"}} {cumulative_count}')
+
+                lines.append(f'{metric}_sum{{{labels}}} {histogram.sum}')
+                lines.append(f'{metric}_count{{{labels}}} {cumulative_count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+metric_registry = MetricRegistry()
+
+
+def _get_payload_size(response: HttpResponse) -> Optional[int]:
+    if isinstance(response, StreamingHttpResponse):
+        return None  # Unknown until streamed
+    else:
+        return len(response.content)
+
+
+def _get_route(request: HttpRequest) -> str:
+    resolver_match = getattr(request, 'resolver_match', None)
+    return resolver_match.route if resolver_match else 'unmatched'
+
+
+class ServerTimingMiddleware:
+    """ Measure each request, expose the measurements in the Server-Timing header, and record them per route.
+
+        The header has the total time, the database time (and the query count), the time spent in each phase (see
+        PHASES) and the payload size. Streamed responses are only measured until the streaming starts.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        timings = RequestTimings()
+        start_time = perf_counter()
+        context_token = _current_timings.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_timings.reset(context_token)
+
+        self._finish(request, response, timings, perf_counter() - start_time)
+
+        return response
+
+    async def __acall__(self, request: HttpRequest):
+        timings = RequestTimings()
+        start_time = perf_counter()
+        context_token = _current_timings.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timings.reset(context_token)
+
+        self._finish(request, response, timings, perf_counter() - start_time)
+
+        return response
+
+    @staticmethod
+    def _finish(request: HttpRequest, response: HttpResponse, timings: RequestTimings, total_duration: float):
+        route = _get_route(request)
+        payload_size = _get_payload_size(response)
+
+        entries = [f'total;dur={total_duration * 1000:.2f}',
+                   f'db;dur={timings.durations.get("db", 0) * 1000:.2f};desc="{timings.query_count} queries"']
+        entries.extend(f'{phase};dur={timings.durations[phase] * 1000:.2f}'
+                       for phase in PHASES if phase in timings.durations)
+        if payload_size is not None:
+            entries.append(f'payload;desc="{payload_size} bytes"')
+
+        response.headers['Server-Timing'] = ', '.join(entries)
+        response.headers['Timing-Allow-Origin'] = '*'
+
+        metric_registry.observe('minesweeper_request_duration_seconds', route, request.method, total_duration,
+                                TIME_BUCKETS)
+        metric_registry.observe('minesweeper_request_db_queries', route, request.method, timings.query_count,
+                                QUERY_COUNT_BUCKETS)
+
+        for phase in ['db', *PHASES]:
+            if phase in timings.durations:
+                metric_registry.observe(f'minesweeper_request_{phase}_seconds', route, request.method,
+                                        timings.durations[phase], TIME_BUCKETS)
+
+        if payload_size is not None:
+            metric_registry.observe('minesweeper_response_size_bytes', route, request.method, payload_size,
+                                    PAYLOAD_SIZE_BUCKETS)
+
+
+def is_metrics_access_allowed(request: HttpRequest) -> bool:
+    """ Only allow the scraper with the METRICS_TOKEN environment variable as the bearer token.
+
+        The metrics are not accessible at all if the token is not configured.
+    """
+    metrics_token = os.environ.get('METRICS_TOKEN')
+
+    if not metrics_token:
+        return False
+
+    # NOTE: Compared as bytes, as the header may have any non-ASCII character.
+    return hmac.compare_digest(request.headers.get('authorization', '').encode(), f'Bearer {metrics_token}'.encode())
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar('V')
+
+
+class LRUCache(Generic[V]):
+    """ Thread-safe, size-bounded, least-recently-used cache
+
+        The entries may also expire after the time-to-live (in seconds), either the default one of the cache or the one
+        given when the entry is stored.
+    """
+
+    def __init__(self, max_size: int, ttl: Optional[float] = None):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries: 'OrderedDict[Hashable, Tuple[V, Optional[float]]]' = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            value, expiry_time = entry
+
+            if expiry_time is not None and expiry_time <= monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: V, ttl: Optional[float] = None):
+        ttl = ttl if ttl is not None else self._ttl
+
+        with self._lock:
+            self._entries[key] = (value, monotonic() + ttl if ttl is not None else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def setdefault(self, key: Hashable, value: V, ttl: Optional[float] = None) -> V:
+        """ Store the value unless the key is already cached, and return the cached value """
+        ttl = ttl if ttl is not None else self._ttl
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and (entry[1] is None or entry[1] > monotonic()):
+                self._entries.move_to_end(key)
+                return entry[0]
+
+            self._entries[key] = (value, monotonic() + ttl if ttl is not None else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+            return value
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,58 @@
+import math
+import random
+from typing import Dict, List, Optional
+
+
+def sample_distinct_indexes(population_size: int, sample_size: int, rng: random.Random) -> List[int]:
+    """ Sample distinct indexes from range(population_size) without retries.
+
+        This is a partial Fisher-Yates shuffle where only the swapped positions are remembered, so both the time and
+        the memory are O(sample_size), regardless of the population size.
+    """
+    swapped: Dict[int, int] = dict()
+    sample: List[int] = []
+
+    # NOTE: The methods are bound to the local variables as this loop may run for millions of times.
+    draw = rng.random
+    lookup = swapped.get
+    append = sample.append
+
+    for position in range(sample_size):
+        # The float-based draw is much faster than randrange, and its bias is negligible for any board size.
+        target = position + int(draw() * (population_size - position))
+        append(lookup(target, target))
+        swapped[target] = lookup(position, position)
+
+    return sample
+
+
+def compute_mine_count(width: int, height: int, mine_density: int) -> int:
+    return min(width * height, math.ceil(width * height * mine_density / 100))
+
+
+def place_mines(width: int, height: int, mine_count: int, seed: Optional[int] = None) -> bytearray:
+    """ Randomly place the mines on the board.
+
+        Returns the mine flags, one byte per square (indexed by "y * width + x"), 1 for a mine and 0 otherwise. The
+        placement is reproducible with the same seed.
+
+        For a dense board, the safe squares are sampled instead of the mines, so the number of random draws never
+        exceeds half of the board.
+    """
+    size = width * height
+    mine_count = max(0, min(size, mine_count))
+    rng = random.Random(seed)
+
+    if mine_count <= size // 2:
+        mine_flags = bytearray(size)
+        flag = 1
+        indexes = sample_distinct_indexes(size, mine_count, rng)
+    else:
+        mine_flags = bytearray(b'\x01') * size
+        flag = 0
+        indexes = sample_distinct_indexes(size, size - mine_count, rng)
+
+    for index in indexes:
+        mine_flags[index] = flag
+
+    return mine_flags
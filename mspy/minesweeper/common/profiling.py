@@ -0,0 +1,237 @@
+import cProfile
+import hmac
+import os
+import pstats
+import random
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from threading import Event, Lock, Thread, get_ident
+from time import perf_counter, strftime
+from typing import List, Optional, Set
+from uuid import uuid4
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpRequest, HttpResponse
+
+SAMPLING_INTERVAL = 0.001  # in seconds, for the stack samples
+MAX_PROFILE_COUNT = 200  # The number of the latest profiles to keep
+MAX_TOTAL_SIZE = 100 * 1024 * 1024  # in bytes, for all profiles
+PROFILE_HEADER = 'X-Profile'  # The request header with PROFILING_TOKEN to profile the request on demand
+
+
+class RequestProfile:
+    """ The profile of one request, collected from every thread working on it
+
+        The stacks of the threads running the segments of work, e.g., the request in the middleware or a task in the
+        engine thread pool, are sampled, and each segment is also profiled with cProfile if traced. The segments on the
+        event loop thread must not be traced, as cProfile allows only one active profiler per thread while the
+        requests on the loop interleave.
+    """
+
+    def __init__(self):
+        self.id = uuid4().hex[:8]
+        self._profiles: List[cProfile.Profile] = []
+        self._thread_ids: Set[int] = set()
+        self._samples: Counter = Counter()
+        self._lock = Lock()
+        self._stopped = Event()
+        self._sampler = Thread(target=self._sample, name=f'profile-sampler-{self.id}', daemon=True)
+
+    def start(self):
+        self._sampler.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._sampler.join()
+
+    @contextmanager
+    def segment(self, traced: bool = True):
+        """ Sample the current thread during the block, and also profile it with cProfile if traced """
+        profile = cProfile.Profile() if traced else None
+        thread_id = get_ident()
+
+        with self._lock:
+            self._thread_ids.add(thread_id)
+
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+
+            with self._lock:
+                self._thread_ids.discard(thread_id)
+
+                if profile is not None:
+                    self._profiles.append(profile)
+
+    def _sample(self):
+        while not self._stopped.wait(SAMPLING_INTERVAL):
+            with self._lock:
+                thread_ids = list(self._thread_ids)
+
+            frames = sys._current_frames()
+
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self._samples[_collapse_stack(frame)] += 1
+
+    def save(self, directory: Path, name: str):
+        """ Write the cProfile statistics (.prof) and the collapsed stack samples (.collapsed) for flame graphs """
+        directory.mkdir(parents=True, exist_ok=True)
+
+        with self._lock:
+            profiles = [profile for profile in self._profiles if profile.getstats()]
+            samples = list(self._samples.items())
+
+        if profiles:
+            pstats.Stats(*profiles).dump_stats(str(directory / f'{name}.prof'))
+
+        with open(directory / f'{name}.collapsed', 'w') as f:
+            for stack, count in samples:
+                f.write(f'{stack} {count}\n')
+
+
+def _collapse_stack(frame) -> str:
+    names: List[str] = []
+
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}'.replace(' ', '_').replace(';', ':'))
+        frame = frame.f_back
+
+    return ';'.join(reversed(names))
+
+
+# The profile of the current request, if profiled, propagated to the engine thread pool
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar('request_profile', default=None)
+
+# Write the profiles off the request path, one at a time.
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='profile-writer')
+
+
+@contextmanager
+def profile_segment():
+    """ Profile the block as a part of the current request, if profiled """
+    profile = _current_profile.get()
+
+    if profile is None:
+        yield
+    else:
+        with profile.segment():
+            yield
+
+
+def _is_same_token(given_token: str, token: str) -> bool:
+    """ Compare the tokens in constant time, also for any non-ASCII header value """
+    return hmac.compare_digest(given_token.encode(), token.encode())
+
+
+def _rotate(directory: Path):
+    """ Delete the oldest profiles beyond MAX_PROFILE_COUNT or MAX_TOTAL_SIZE """
+    profiles = {}
+
+    for path in directory.iterdir():
+        if path.suffix in ('.prof', '.collapsed'):
+            profiles.setdefault(path.stem, []).append(path)
+
+    names = sorted(profiles, key=lambda name: max(path.stat().st_mtime for path in profiles[name]), reverse=True)
+    total_size = 0
+
+    for index, name in enumerate(names):
+        total_size += sum(path.stat().st_size for path in profiles[name])
+
+        if index >= MAX_PROFILE_COUNT or total_size > MAX_TOTAL_SIZE:
+            for path in profiles[name]:
+                path.unlink(missing_ok=True)
+
+
+def _save(profile: RequestProfile, directory: Path, name: str):
+    profile.save(directory, name)
+    _rotate(directory)
+
+
+class ProfilingMiddleware:
+    """ Profile the requests on demand, i.e., with PROFILING_TOKEN in the X-Profile header, or by sampling.
+
+        This is disabled unless the PROFILING_DIR environment variable is set. PROFILING_SAMPLE_RATE (default: 0) is the
+        fraction of the requests to profile. The profiles are written to PROFILING_DIR, named after the time, the route
+        and the duration of the request, and the name is in the X-Profile-Id response header.
+
+        Under ASGI, the event loop thread is only sampled (not traced with cProfile), so its samples may include the
+        other requests running concurrently. The work in the engine thread pool is traced as usual.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._directory = Path(os.environ['PROFILING_DIR']) if os.environ.get('PROFILING_DIR') else None
+        self._token = os.environ.get('PROFILING_TOKEN')
+        self._sample_rate = float(os.environ.get('PROFILING_SAMPLE_RATE') or 0)
+
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _should_profile(self, request: HttpRequest) -> bool:
+        if self._directory is None:
+            return False
+        elif self._token and _is_same_token(request.headers.get(PROFILE_HEADER, ''), self._token):
+            return True
+        else:
+            return random.random() < self._sample_rate
+
+    def __call__(self, request: HttpRequest):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if not self._should_profile(request):
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        context_token = _current_profile.set(profile)
+        start_time = perf_counter()
+        profile.start()
+        try:
+            with profile.segment():
+                response = self.get_response(request)
+        finally:
+            profile.stop()
+            _current_profile.reset(context_token)
+
+        return self._finish(request, response, profile, perf_counter() - start_time)
+
+    async def __acall__(self, request: HttpRequest):
+        if not self._should_profile(request):
+            return await self.get_response(request)
+
+        profile = RequestProfile()
+        context_token = _current_profile.set(profile)
+        start_time = perf_counter()
+        profile.start()
+        try:
+            with profile.segment(traced=False):
+                response = await self.get_response(request)
+        finally:
+            profile.stop()
+            _current_profile.reset(context_token)
+
+        return self._finish(request, response, profile, perf_counter() - start_time)
+
+    def _finish(self, request: HttpRequest, response: HttpResponse, profile: RequestProfile, duration: float):
+        resolver_match = getattr(request, 'resolver_match', None)
+        route = resolver_match.route if resolver_match else 'unmatched'
+        route_name = ''.join(character if character.isalnum() else '_' for character in route).strip('_')
+        name = f'{strftime("%Y%m%d-%H%M%S")}-{request.method}-{route_name}-{duration * 1000:.0f}ms-{profile.id}'
+
+        _writer.submit(_save, profile, self._directory, name)
+        response.headers['X-Profile-Id'] = name
+
+        return response
@@ -1,14 +1,25 @@
+import base64
+import hashlib
 import json
-from typing import Optional, TypeVar, Type, Callable, Dict, Any, List
+from typing import Optional, TypeVar, Type, Callable, Dict, Any, List, AsyncIterable
 
+from django.db.models import Q, QuerySet
 from django.forms import model_to_dict
-from django.http import HttpRequest, JsonResponse, HttpResponse
-from imagination import container
-from jwt import ExpiredSignatureError
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpRequest, JsonResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
 
-from minesweeper.common.token_service import TokenService
+from minesweeper.common.authentication import decode_authorization_header
+from minesweeper.common.engine_pool import run_in_engine_pool
+from minesweeper.common.instrumentation import measure
 
-token_service: TokenService = container.get(TokenService)
+
+MAX_PAGE_SIZE = 1000
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+FALSE_VALUES = ('', '0', 'false', 'no', 'off')
+STREAM_CHUNK_SIZE = 500  # The number of rows fetched from the server-side cursor at a time when streaming
 
 
 class AccessDeniedError(RuntimeError):
@@ -20,16 +31,14 @@ class UnauthenticatedError(RuntimeError):
 
 
 def decode_bearer_token(request: HttpRequest):
-    """ Decode the bearer token """
-    bearer_token = request.headers.get('authorization')
+    """ Decode the bearer token
 
-    if not bearer_token:
-        return None
+        The claims are normally decoded once by BearerTokenAuthenticationMiddleware.
+    """
+    if hasattr(request, 'token_claims'):
+        return request.token_claims
     else:
-        try:
-            return token_service.decode_token(bearer_token[7:])
-        except ExpiredSignatureError as e:
-            return None
+        return decode_authorization_header(request)
 
 
 def get_authorized_user_id(request: HttpRequest, scope: str) -> int:
@@ -45,32 +54,177 @@ def get_authorized_user_id(request: HttpRequest, scope: str) -> int:
 
 def respond_ok(obj):
     """ Simply make a JSON response """
-    response = JsonResponse(obj, safe=False)
+    with measure('serialize'):
+        response = JsonResponse(obj, safe=False)
     if isinstance(obj, (list, dict, set, tuple)):
         response.headers['X-Size'] = len(obj)  # For debuggin purpose
     return response
 
 
-def respond_error(status: int, error_message: Optional[str] = None):
+def get_boolean_parameter(request: HttpRequest, name: str) -> bool:
+    """ Get the query parameter as a boolean, false if absent. Raises ValueError with the name for any other value. """
+    value = request.GET.get(name, '').lower()
+
+    if value in TRUE_VALUES:
+        return True
+    elif value in FALSE_VALUES:
+        return False
+    else:
+        raise ValueError(name)
+
+
+def is_streaming_supported(request: HttpRequest) -> bool:
+    """ Check if an asynchronous streaming response is sent as it goes, i.e., only under ASGI.
+
+        Under WSGI, e.g., "manage.py runserver", Django collects the whole stream before sending it, so an endless
+        stream never responds and a long one is held in memory.
+    """
+    return isinstance(request, ASGIRequest)
+
+
+def respond_encoded_json(body: bytes):
+    """ Make a JSON response with the already encoded body """
+    return HttpResponse(body, content_type='application/json')
+
+
+def respond_error(status: int, error_message: Optional[str] = None, **details):
     """ Simply make an error JSON response, except HTTP 401 """
     if status == 401:
         return HttpResponse('', status=401)
     else:
-        return JsonResponse({'error': error_message}, status=status)
+        return JsonResponse({'error': error_message, **details}, status=status)
+
+
+def make_etag(*parts: Any) -> str:
+    """ Make a strong ETag from the given parts, e.g., a version number and a representation name """
+    return '"' + hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest() + '"'
+
+
+def is_not_modified(request: HttpRequest, etag: str) -> bool:
+    """ Check the If-None-Match header against the current ETag (weak comparison as per RFC 9110) """
+    header = request.headers.get('if-none-match')
+
+    if not header:
+        return False
+
+    candidates = parse_etags(header)
+
+    return '*' in candidates or etag in [candidate.removeprefix('W/') for candidate in candidates]
+
+
+def set_etag(response: HttpResponse, etag: str) -> HttpResponse:
+    """ Set the ETag and let the client cache the response as long as it revalidates it """
+    response.headers['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def respond_not_modified(etag: str) -> HttpResponse:
+    return set_etag(HttpResponse(status=304), etag)
 
 
 T = TypeVar('T')
 
 
-def handle_root_api_request(request: HttpRequest,
-                            cls: Type[T],
-                            map_dict_to_object: Callable[[Dict[str, Any]], T],
-                            sorting_order: List[str],
-                            reiterate_list: Optional[Callable[[List[T]], List[T]]],
-                            listing_limit: Optional[int] = None):
+def _get_keyset(sorting_order: List[str]) -> List[str]:
+    """ Get the sorting keys for the keyset pagination, with the ID as the tie-breaker """
+    keys = list(sorting_order)
+
+    if not any(key.lstrip('-') in ('id', 'pk') for key in keys):
+        keys.append('-id' if keys and keys[0].startswith('-') else 'id')
+
+    return keys
+
+
+def encode_cursor(obj: Any, keys: List[str]) -> str:
+    values = [getattr(obj, key.lstrip('-')) for key in keys]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def filter_after_cursor(query: QuerySet, keys: List[str], cursor: str) -> QuerySet:
+    """ Only keep the objects after the cursor, i.e., (key_1, ..., key_n) > cursor in the sorting order """
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise ValueError('invalid_cursor')
+
+    condition = Q()
+    preceding_keys: Dict[str, Any] = dict()
+
+    for key, value in zip(keys, values):
+        name = key.lstrip('-')
+        lookup = 'lt' if key.startswith('-') else 'gt'
+        condition |= Q(**preceding_keys, **{f'{name}__{lookup}': value})
+        preceding_keys[name] = value
+
+    return query.filter(condition)
+
+
+async def stream_objects(objects: AsyncIterable[T], serialize: Callable[[T], Dict[str, Any]], line_delimited: bool):
+    """ Encode the objects incrementally, as one JSON array or as newline-delimited JSON, one chunk at a time """
+    encoder = DjangoJSONEncoder()
+    separator = '\n' if line_delimited else ', '
+    chunk: List[str] = []
+    first = True
+
+    if not line_delimited:
+        yield '['
+
+    async for obj in objects:
+        if not first and not line_delimited:
+            chunk.append(separator)
+        chunk.append(encoder.encode(serialize(obj)))
+        if line_delimited:
+            chunk.append(separator)
+        first = False
+
+        if len(chunk) >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk.clear()
+
+    if chunk:
+        yield ''.join(chunk)
+
+    if not line_delimited:
+        yield ']'
+
+
+async def handle_root_api_request(request: HttpRequest,
+                                  cls: Type[T],
+                                  map_dict_to_object: Optional[Callable[[Dict[str, Any]], T]],
+                                  sorting_order: List[str],
+                                  reiterate_list: Optional[Callable[[List[T]], List[T]]],
+                                  listing_limit: Optional[int] = None,
+                                  serialize: Callable[[T], Dict[str, Any]] = model_to_dict,
+                                  refine_query: Optional[Callable[[QuerySet], QuerySet]] = None,
+                                  tag_listing: bool = False,
+                                  listed_fields: Optional[List[str]] = None,
+                                  streamable: bool = False):
     """ Handle all requests at the root level of the rest API, e.g., "/api/<resource_type>/".
 
         This includes listing all resources owned by the authenticated user and creating a new resource.
+
+        The listing is paginated by keyset on the sorting order (plus the ID), with the page size from the "page_size"
+        query parameter (default: "listing_limit", unlimited if not set). If there are more objects, the opaque cursor
+        of the next page is given in the "X-Next-Cursor" and "Link" headers, to be sent back as the "cursor" query
+        parameter.
+
+        The listing query can be refined by the database, e.g., for deduplication, with "refine_query". If
+        "listed_fields" is given, only these columns are fetched.
+
+        If "tag_listing" is set, the ETag of a listing page is computed from its content, so that the client gets HTTP
+        304 instead of an unchanged page, without any false match.
+
+        If "map_dict_to_object" is not given, the resources cannot be created with this API. Otherwise, when a new
+        resource is created, "map_dict_to_object" runs in the engine thread pool, as it may be CPU-heavy. It may raise
+        KeyError or ValueError with the name of the missing or invalid field, i.e., HTTP 400.
+
+        If "streamable" is set, the client may ask for a streaming response with the "stream" query parameter, either
+        "json" (one JSON array) or "ndjson" (newline-delimited JSON). The objects are then read from a server-side
+        cursor and encoded incrementally, so the memory usage stays constant. A streaming response is not paginated,
+        i.e., it includes all objects after the cursor, and "reiterate_list" is not applied. Streaming requires ASGI
+        (see is_streaming_supported), and HTTP 501 is returned otherwise.
     """
     try:
         user_id = get_authorized_user_id(request, 'game')
@@ -86,38 +240,108 @@ def handle_root_api_request(request: HttpRequest,
             if k.startswith('filter_') and v
         }
 
-        cursor = cls.objects.filter(userId=user_id, **filters)
-        if sorting_order:
-            cursor = cursor.order_by(*sorting_order)
-        if listing_limit and listing_limit > 0:
-            cursor = cursor[:listing_limit]
+        try:
+            page_size = int(request.GET['page_size']) if request.GET.get('page_size') else listing_limit
+        except ValueError:
+            return respond_error(400, 'invalid_request/page_size')
+
+        if page_size is not None and page_size <= 0:
+            page_size = None if listing_limit is None else listing_limit
+        if page_size is not None:
+            page_size = min(page_size, MAX_PAGE_SIZE)
+
+        query = cls.objects.filter(userId=user_id, **filters)
+        if refine_query:
+            query = refine_query(query)
+
+        keys = _get_keyset(sorting_order)
+        cursor = query.order_by(*keys)
 
-        obj_list = [obj for obj in cls.objects.filter(userId=user_id, **filters).order_by(*sorting_order)]
+        if listed_fields:
+            cursor = cursor.only(*listed_fields)
+
+        if request.GET.get('cursor'):
+            try:
+                cursor = filter_after_cursor(cursor, keys, request.GET['cursor'])
+            except (ValueError, TypeError):
+                return respond_error(400, 'invalid_request/cursor')
+
+        stream_format = request.GET.get('stream') if streamable else None
+
+        if stream_format in ('json', 'ndjson'):
+            if not is_streaming_supported(request):
+                return respond_error(501, 'not_supported/streaming')
+
+            line_delimited = stream_format == 'ndjson'
+            response = StreamingHttpResponse(
+                stream_objects(cursor.aiterator(chunk_size=STREAM_CHUNK_SIZE), serialize, line_delimited),
+                content_type='application/x-ndjson' if line_delimited else 'application/json',
+            )
+            return response
+
+        if page_size is not None:
+            # Fetch one more object to know if there is a next page.
+            cursor = cursor[:page_size + 1]
+
+        obj_list = [obj async for obj in cursor]
+        next_cursor = None
+
+        if page_size is not None and len(obj_list) > page_size:
+            obj_list = obj_list[:page_size]
+            next_cursor = encode_cursor(obj_list[-1], keys)
 
         if reiterate_list:
             obj_list = reiterate_list(obj_list)
 
-        return respond_ok([model_to_dict(obj) for obj in obj_list])
+        response = respond_ok([serialize(obj) for obj in obj_list])
+
+        if next_cursor:
+            next_query = request.GET.copy()
+            next_query['cursor'] = next_cursor
+            response.headers['X-Next-Cursor'] = next_cursor
+            response.headers['Link'] = f'<{request.path}?{next_query.urlencode()}>; rel="next"'
+
+        if tag_listing:
+            etag = make_etag(request.get_full_path(), hashlib.sha1(response.content).hexdigest())
+
+            if is_not_modified(request, etag):
+                return respond_not_modified(etag)
+
+            set_etag(response, etag)
+
+        return response
     elif request.method == 'POST':
+        if map_dict_to_object is None:
+            return respond_error(405, 'method_not_allowed')
+
         request_body = json.loads(request.body)
         try:
-            new_obj = map_dict_to_object(request_body)
-            new_obj.save()
+            new_obj = await run_in_engine_pool(map_dict_to_object, request_body)
+            await new_obj.asave()
 
-            return respond_ok(model_to_dict(new_obj))
-        except KeyError as e:
+            return respond_ok(serialize(new_obj))
+        except (KeyError, ValueError) as e:
+            # The missing or invalid field
             return respond_error(400, f'invalid_request/{e.args[0]}')
     else:
         return respond_error(405, 'method_not_allowed')
 
 
-def handle_api_request_for_one_resource(request: HttpRequest,
-                                        cls: Type[T],
-                                        id: Any,
-                                        map_dict_to_object: Optional[Callable[[T, Dict[str, Any]], T]]):
+async def handle_api_request_for_one_resource(request: HttpRequest,
+                                              cls: Type[T],
+                                              id: Any,
+                                              map_dict_to_object: Optional[Callable[[T, Dict[str, Any]], T]],
+                                              serialize: Callable[[T], Dict[str, Any]] = model_to_dict,
+                                              get_version: Optional[Callable[[T], Any]] = None,
+                                              version_field: Optional[str] = None):
     """ Handle all requests for one resource, identified by "id", e.g., "/api/<resource_type>/<id>".
 
         This includes fetching ONE resource by ID, updating it (partial replacement), and deleting it.
+
+        If "get_version" is given, the version of the resource is used as the ETag of the resource.
+
+        If "version_field" is given, an update only saves the changed fields if the resource is still at the version
+        it was loaded at, i.e., compare-and-swap, and moves the resource to the next version. Otherwise, HTTP 409.
     """
     try:
         user_id = get_authorized_user_id(request, 'game')
@@ -126,7 +350,7 @@ def handle_api_request_for_one_resource(request: HttpRequest,
     except AccessDeniedError as e:
         return respond_error(403, e.args[0])
 
-    obj = cls.objects.get(id=id)
+    obj = await cls.objects.filter(id=id).afirst()
 
     if obj is None:
         return respond_error(404, 'not_found')
@@ -135,21 +359,53 @@ def handle_api_request_for_one_resource(request: HttpRequest,
         return respond_error(404, 'not_found')  # Fake 404 to prevent scanning.
 
     if request.method == 'GET':
-        if obj:
-            return respond_ok(model_to_dict(obj))
-        else:
+        if not obj:
             return respond_error(404, 'not_found')
+
+        if get_version is None:
+            return respond_ok(await run_in_engine_pool(serialize, obj))
+
+        etag = make_etag(get_version(obj))
+
+        if is_not_modified(request, etag):
+            return respond_not_modified(etag)
+        else:
+            return set_etag(respond_ok(await run_in_engine_pool(serialize, obj)), etag)
     elif request.method == 'PUT':
         if map_dict_to_object is None:
             return respond_error(405, 'method_not_allowed')
 
         request_body = json.loads(request.body)
-        updated_obj = map_dict_to_object(obj, request_body)
-        updated_obj.save()
+        field_names = [field.attname for field in cls._meta.concrete_fields]
+        original_values = {field_name: getattr(obj, field_name) for field_name in field_names}
+
+        try:
+            updated_obj = map_dict_to_object(obj, request_body)
+        except (KeyError, ValueError) as e:
+            return respond_error(400, f'invalid_request/{e.args[0]}')
+
+        if version_field is None:
+            await updated_obj.asave()
+            return respond_ok(serialize(updated_obj))
+
+        base_version = original_values[version_field]
+        changes = {
+            field_name: getattr(updated_obj, field_name)
+            for field_name in field_names
+            if field_name != version_field and getattr(updated_obj, field_name) != original_values[field_name]
+        }
+
+        updated_count = await cls.objects.filter(pk=obj.pk, **{version_field: base_version}) \
+            .aupdate(**changes, **{version_field: base_version + 1})
+
+        if updated_count == 0:
+            return respond_error(409, 'conflict/concurrent_update')
+
+        setattr(updated_obj, version_field, base_version + 1)
 
-        return respond_ok(model_to_dict(obj))
+        return respond_ok(serialize(updated_obj))
     elif request.method == 'DELETE':
-        obj.delete()
+        await obj.adelete()
         return HttpResponse(content='', status=204)
     else:
         return respond_error(405, 'method_not_allowed')
\ No newline at end of file
@@ -0,0 +1,156 @@
+from collections import deque
+from itertools import compress
+from typing import Deque, List
+
+from minesweeper.common.board import Board, MINE_MASK, NEARBY_MINE_COUNT_MASK, STATE_CODES, STATE_SHIFT, pack_bits, \
+    unpack_bits
+
+# The squares in these states must not be revealed again.
+_SETTLED_STATE_CODES = frozenset({STATE_CODES['cleared'], STATE_CODES['flagged'], STATE_CODES['exploded']})
+
+# Lookup table: True if the square (as its packed byte) cannot be revealed by the flood.
+_BLOCKED = tuple(
+    bool(cell & MINE_MASK) or (cell >> STATE_SHIFT) in _SETTLED_STATE_CODES
+    for cell in range(256)
+)
+
+# From the square (as its packed byte) to 1 if the flood may reveal it, or 0 otherwise
+_OPEN_TABLE = bytes(0 if _BLOCKED[cell] else 1 for cell in range(256))
+
+# From the square (as its packed byte) to 1 if the flood may expand through it, i.e., no nearby mines, or 0 otherwise
+_EMPTY_TABLE = bytes(0 if _BLOCKED[cell] or cell & NEARBY_MINE_COUNT_MASK else 1 for cell in range(256))
+
+
+def reveal_area(board: Board, origin: int) -> List[int]:
+    """ Compute the squares revealed by clicking on the origin (as the board index).
+
+        Like the real Minesweeper, the flood only expands through the squares without any nearby mines. A numbered
+        square is revealed but stops the flood. Mines and settled squares, i.e., cleared, flagged or exploded, are
+        never revealed.
+
+        The flood is computed on the whole board at once, as repeated 3x3 dilations of one big integer where each bit
+        is one square, until the area stops growing. Each dilation grows the area by one square in every direction, so
+        a winding area, e.g., walled by flags, falls back to the breadth-first flood after too many dilations.
+
+        The board is not modified. Returns the board indexes of the newly revealed squares, in ascending order.
+    """
+    cells = board.cells
+    width = board.width
+    height = board.height
+
+    if _BLOCKED[cells[origin]]:
+        return []
+    elif cells[origin] & NEARBY_MINE_COUNT_MASK:
+        return [origin]
+
+    # NOTE: The board is padded with one blocked square on each side, so that no bit ever wraps into the next row.
+    stride = width + 2
+    empty = _to_padded_bits(cells.translate(_EMPTY_TABLE), width, height)
+    area = 1 << (stride * (origin // width + 1) + origin % width + 1)
+
+    for _ in range(2 * (width + height)):
+        row = area | (area << 1) | (area >> 1)
+        dilated_area = row | (row << stride) | (row >> stride)
+        expanded_area = dilated_area & empty
+
+        if expanded_area == area:
+            revealed = dilated_area & _to_padded_bits(cells.translate(_OPEN_TABLE), width, height)
+            return _from_padded_bits(revealed, width, height)
+
+        area = expanded_area
+
+    return sorted(_search_area(board, origin))
+
+
+def _to_padded_bits(flags: bytes, width: int, height: int) -> int:
+    """ Pack the flags (one byte per square, 0 or 1) into one big integer, with a border of zeros around the board """
+    stride = width + 2
+    padded_flags = bytearray(stride * (height + 2))
+
+    for y in range(height):
+        start = stride * (y + 1) + 1
+        padded_flags[start:start + width] = flags[y * width:(y + 1) * width]
+
+    return int.from_bytes(pack_bits(padded_flags), 'little')
+
+
+def _from_padded_bits(bits: int, width: int, height: int) -> List[int]:
+    """ Get the board indexes of the set bits, see _to_padded_bits """
+    stride = width + 2
+    padded_size = stride * (height + 2)
+    padded_flags = unpack_bits(bits.to_bytes((padded_size + 7) // 8, 'little'), padded_size)
+    flags = b''.join(padded_flags[stride * (y + 1) + 1:stride * (y + 1) + 1 + width] for y in range(height))
+
+    return list(compress(range(width * height), flags))
+
+
+def _search_area(board: Board, origin: int) -> List[int]:
+    """ Compute the same squares as reveal_area, breadth-first with an explicit queue, one square at a time.
+
+        Unlike the dilations, the time only depends on the size of the area, not on its shape.
+    """
+    cells = board.cells
+    width = board.width
+    size = board.size
+
+    if _BLOCKED[cells[origin]]:
+        return []
+
+    visited = bytearray(size)
+    visited[origin] = 1
+    queue: Deque[int] = deque([origin])
+    revealed: List[int] = [origin]
+
+    while queue:
+        index = queue.popleft()
+
+        if cells[index] & NEARBY_MINE_COUNT_MASK:
+            continue
+
+        column = index % width
+        row_offsets = (-width, 0, width)
+        column_offsets = (
+            (0, 1) if column == 0
+            else ((-1, 0) if column == width - 1 else (-1, 0, 1))
+        ) if width > 1 else (0,)
+
+        for row_offset in row_offsets:
+            row_index = index + row_offset
+            if row_index < 0 or row_index >= size:
+                continue
+            for column_offset in column_offsets:
+                neighbour = row_index + column_offset
+                if visited[neighbour] or _BLOCKED[cells[neighbour]]:
+                    continue
+                visited[neighbour] = 1
+                revealed.append(neighbour)
+                queue.append(neighbour)
+        # end: for
+    # end: while
+
+    return revealed
+
+
+def get_chord_targets(board: Board, index: int) -> List[int]:
+    """ Get the squares revealed by chording on the given square (as the board index).
+
+        Chording only works on a cleared square where the number of the flagged surrounding squares matches the number
+        of nearby mines. Then, all surrounding squares which are not settled yet are revealed, including the mines if
+        the flags are wrong.
+    """
+    nearby_mine_count = board.get_nearby_mine_count(index)
+
+    if board.get_state_code(index) != STATE_CODES['cleared'] or nearby_mine_count == 0:
+        return []
+
+    neighbours = board.get_neighbours(index)
+    flagged_count = sum(1 for neighbour in neighbours if board.get_state_code(neighbour) == STATE_CODES['flagged'])
+
+    if flagged_count != nearby_mine_count:
+        return []
+
+    return [
+        neighbour
+        for neighbour in neighbours
+        if board.get_state_code(neighbour) not in _SETTLED_STATE_CODES
+    ]
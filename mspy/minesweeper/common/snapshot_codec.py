@@ -0,0 +1,158 @@
+""" Compact binary encoding of the game snapshot
+
+    Layout (big-endian):
+
+    * Header: magic (4 bytes, "MSPK"), format version (uint8), flags (uint8), width (uint32), height (uint32),
+      board version (uint32), and the length of the game info (uint16) followed by the game info as UTF-8 JSON.
+    * States section: the length of the section (uint32) followed by the state codes of all squares, 4 bits per square,
+      two squares per byte where the first square is in the high nibble.
+    * Hints section: the length of the section (uint32) followed by the nearby mine counts, one byte per square.
+
+    The squares are ordered by "y * width + x". If the RLE flag is set, both sections are run-length encoded as pairs of
+    (run length as uint8, value as uint8).
+"""
+import gzip
+import json
+import struct
+from typing import Any, Dict, Optional
+
+from minesweeper.common.board import Board, STATE_NAMES
+
+try:
+    import brotli
+except ImportError:  # Optional dependency
+    brotli = None
+
+CONTENT_TYPE = 'application/vnd.minesweeper.snapshot+packed'
+MAGIC = b'MSPK'
+FORMAT_VERSION = 1
+FLAG_RUN_LENGTH_ENCODED = 0b00000001
+
+_HEADER = struct.Struct('>4sBBIIIH')
+_SECTION_LENGTH = struct.Struct('>I')
+
+_HIGH_NIBBLE_TABLE = bytes((value << 4) & 0xFF for value in range(256))
+
+
+def pack_nibbles(values: bytes) -> bytes:
+    """ Pack the values (0-15) into two values per byte """
+    if len(values) % 2:
+        values = values + b'\x00'
+    return bytes(map(int.__or__, values[0::2].translate(_HIGH_NIBBLE_TABLE), values[1::2]))
+
+
+def unpack_nibbles(packed: bytes, count: int) -> bytes:
+    values = bytearray(len(packed) * 2)
+    values[0::2] = bytes(value >> 4 for value in packed)
+    values[1::2] = bytes(value & 0x0F for value in packed)
+    return bytes(values[:count])
+
+
+def run_length_encode(data: bytes) -> bytes:
+    encoded = bytearray()
+    position = 0
+    size = len(data)
+
+    while position < size:
+        value = data[position]
+        end = position + 1
+        limit = min(size, position + 255)
+        while end < limit and data[end] == value:
+            end += 1
+        encoded.append(end - position)
+        encoded.append(value)
+        position = end
+
+    return bytes(encoded)
+
+
+def run_length_decode(data: bytes) -> bytes:
+    decoded = bytearray()
+    for offset in range(0, len(data), 2):
+        decoded.extend(data[offset + 1:offset + 2] * data[offset])
+    return bytes(decoded)
+
+
+def encode_packed_snapshot(info: Dict[str, Any], board: Board, run_length_encoded: bool = False) -> bytes:
+    states = pack_nibbles(board.get_state_codes())
+    hints = board.get_nearby_mine_counts()
+    flags = 0
+
+    if run_length_encoded:
+        flags |= FLAG_RUN_LENGTH_ENCODED
+        states = run_length_encode(states)
+        hints = run_length_encode(hints)
+
+    encoded_info = json.dumps(info).encode()
+
+    return b''.join([
+        _HEADER.pack(MAGIC, FORMAT_VERSION, flags, board.width, board.height, info.get('version') or 0,
+                     len(encoded_info)),
+        encoded_info,
+        _SECTION_LENGTH.pack(len(states)),
+        states,
+        _SECTION_LENGTH.pack(len(hints)),
+        hints,
+    ])
+
+
+def decode_packed_snapshot(data: bytes) -> Dict[str, Any]:
+    """ Decode the packed snapshot into the same structure as GameSnapshot """
+    magic, format_version, flags, width, height, version, info_length = _HEADER.unpack_from(data)
+
+    if magic != MAGIC or format_version != FORMAT_VERSION:
+        raise ValueError('unsupported_format')
+
+    offset = _HEADER.size
+    info = json.loads(data[offset:offset + info_length])
+    offset += info_length
+
+    sections = []
+    for _ in range(2):
+        (length,) = _SECTION_LENGTH.unpack_from(data, offset)
+        offset += _SECTION_LENGTH.size
+        section = data[offset:offset + length]
+        offset += length
+        sections.append(run_length_decode(section) if flags & FLAG_RUN_LENGTH_ENCODED else section)
+
+    size = width * height
+    states = unpack_nibbles(sections[0], size)
+    hints = sections[1]
+
+    return dict(
+        info=info,
+        moves=[
+            dict(x=index % width, y=index // width, state=STATE_NAMES[code])
+            for index, code in enumerate(states)
+            if code
+        ],
+        hint=dict(
+            nearby_mine_count=[list(hints[y * width:(y + 1) * width]) for y in range(height)],
+        ),
+    )
+
+
+def negotiate_content_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """ Pick the best supported content encoding from the Accept-Encoding header """
+    accepted = {
+        token.split(';')[0].strip().lower()
+        for token in (accept_encoding or '').split(',')
+        if token.strip() and not token.strip().endswith(';q=0')
+    }
+
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    elif 'gzip' in accepted:
+        return 'gzip'
+    else:
+        return None
+
+
+def compress(data: bytes, content_encoding: Optional[str]) -> bytes:
+    if content_encoding == 'br':
+        return brotli.compress(data)
+    elif content_encoding == 'gzip':
+        return gzip.compress(data, mtime=0)
+    else:
+        return data
+
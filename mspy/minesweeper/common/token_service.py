@@ -14,6 +14,7 @@ class TokenService:
         self._issuer = 'minesweeper'
         self._access_token_ttl = 7200  # 2 hours
         self._refresh_token_ttl = 86400  # 1 day
+        self._event_token_ttl = 300  # 5 minutes
 
     def _generate_tokens(self, subject_id):
         issue_time = time()
@@ -42,6 +43,21 @@ class TokenService:
     def generate_tokens(self, user: User):
         return self._generate_tokens(user.pk)
 
+    def generate_event_token(self, subject_id, session_id: str):
+        """ Generate a short-lived token to subscribe to the events of one game, i.e., as a query parameter """
+        claims = {
+            'scope': 'events',
+            'iss': self._issuer,
+            'sub': str(subject_id),
+            'gid': session_id,
+            'exp': time() + self._event_token_ttl,
+        }
+
+        return {
+            "event_token": jwt.encode(claims, self._secret, algorithm='HS256'),
+            "expires_in": claims['exp'] - time(),
+        }
+
     def decode_token(self, token: str) -> Dict[str, Any]:
         return jwt.decode(token, self._secret, algorithms=["HS256"])
 
@@ -1,27 +1,41 @@
 import json
 import math
+from threading import RLock
 from time import time
-from typing import List, Optional, Tuple, Dict, Iterable, Set
+from typing import Any, List, Optional, Tuple, Dict, Iterable, Set
 
-from django.http import HttpRequest
+from django.db import transaction
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django.views.decorators.csrf import csrf_exempt
+from imagination import container
 from pydantic import BaseModel
 
 from minesweeper.common.rest_api_utils import get_authorized_user_id, UnauthenticatedError, respond_error, \
-    AccessDeniedError, respond_ok
+    AccessDeniedError, respond_ok, make_etag, is_not_modified, respond_not_modified, set_etag, \
+    respond_encoded_json, get_boolean_parameter, is_streaming_supported
+from minesweeper.common import snapshot_codec, snapshot_json
+from minesweeper.common.authentication import decode_token
+from minesweeper.common.engine_pool import run_in_engine_pool
+from minesweeper.common.event_broker import GameEventBroker, format_event
+from minesweeper.common.instrumentation import measure
+from minesweeper.common.board import Board, STATE_CODES, compute_nearby_mine_counts, unpack_bits
+from minesweeper.common.board_engine import BoardEngine, KNOWN_STATES
+from minesweeper.common.lru_cache import LRUCache
+from minesweeper.common.token_service import TokenService
 from minesweeper.models import GameMove, GameSession
 
-ACTIVE = 'active'
-CLEARED = 'cleared'
-EXPLODED = 'exploded'
-FLAGGED = 'flagged'
-UNKNOWN = 'unknown'
+PACKED_SNAPSHOT_CACHE_SIZE = 256
+GAME_CACHE_SIZE = 64  # The number of hot games kept by each worker
+GAME_CACHE_TTL = 300  # in seconds
+MAX_BATCH_SIZE = 1000  # The maximum number of moves per batch
+EVENT_RETRY_INTERVAL = 3000  # in milliseconds, for the clients to reconnect to the event stream
+MAX_VISIT_ATTEMPTS = 3  # The number of attempts to apply the moves when the game is concurrently updated
+BULK_CREATE_BATCH_SIZE = 1000  # The number of moves inserted per statement
 
-KNOWN_STATES = [
-    CLEARED,
-    EXPLODED,
-    FLAGGED,
-]
+
+class StaleGameError(RuntimeError):
+    """ The game has been updated by someone else since it was loaded """
 
 
 class GameInfo(BaseModel):
@@ -31,6 +45,7 @@ class GameInfo(BaseModel):
     mine_density: int
     create_time: int
     state: Optional[str] = None
+    version: int = 0
 
     @classmethod
     def make(cls, db_model: GameSession):
@@ -41,6 +56,7 @@ class GameInfo(BaseModel):
             mine_density=db_model.mineDensity,
             create_time=db_model.createTime,
             state=db_model.state,
+            version=db_model.version,
         )
 
 
@@ -61,166 +77,435 @@ class GameSnapshot(BaseModel):
     hint: Hint
 
 
+class ChangedSquare(BaseModel):
+    x: int
+    y: int
+    state: str
+    nearby_mine_count: int
+
+
+class GameDelta(BaseModel):
+    """ The changes made by one visit
+
+        The client can patch its local board if its board version is equal to the base version. Otherwise, the client
+        must fetch the full snapshot.
+    """
+    info: GameInfo
+    base_version: int
+    changes: List[ChangedSquare]
+
+
+class UnitOfWork:
+    """ Collect the new moves and the changed fields of the session, then save them at once in one transaction
+
+        The session is only saved if it is still at the base version, i.e., compare-and-swap, and moved to the next
+        version.
+    """
+
+    def __init__(self, session: GameSession, base_version: int):
+        self._session = session
+        self._base_version = base_version
+        self._new_moves: List[GameMove] = []
+        self._changed_fields: Set[str] = set()
+
+    def add_move(self, move: GameMove):
+        self._new_moves.append(move)
+
+    def mark_changed(self, *field_names: str):
+        self._changed_fields.update(field_names)
+
+    def commit(self):
+        """ Save everything with two statements (plus one per BULK_CREATE_BATCH_SIZE moves), or raise StaleGameError """
+        next_version = self._base_version + 1  # Every evaluated move makes a new version of the board.
+        changes = {field_name: getattr(self._session, field_name) for field_name in self._changed_fields}
+
+        with transaction.atomic():
+            updated_count = GameSession.objects.filter(id=self._session.id, version=self._base_version) \
+                .update(**changes, version=next_version)
+
+            if updated_count == 0:
+                raise StaleGameError(self._session.id)
+
+            GameMove.objects.bulk_create(self._new_moves, batch_size=BULK_CREATE_BATCH_SIZE)
+
+        self._session.version = next_version
+
+
+# The running counters of the session, as (field name of the session, attribute name of the engine)
+_COUNTERS = [
+    ('revealedSafeCount', 'revealed_safe_count'),
+    ('correctFlagCount', 'correct_flag_count'),
+    ('wrongFlagCount', 'wrong_flag_count'),
+    ('exploded', 'exploded'),
+]
+
+
 class Game:
+    """ The persistence adapter of the board engine for one game session """
+
     def __init__(self, info: GameSession):
         self._info = info
-        self._moves: Dict[Tuple[int, int], GameMove] = {
-            move.to_coordinate(): move
-            for move in self._get_moves()
-        }
-        self._mine_positions = [
-            (mine_coordinate['x'], mine_coordinate['y'])
-            for mine_coordinate in self._info.mineCoordinates
-        ]
+        self._engine: Optional[BoardEngine] = None
+        self._base_version: int = info.version
+        self._lock = RLock()
+        self._stale = False
+        self._hint_json: Optional[bytes] = None
 
     @property
     def info(self):
         return self._info
 
-    def _get_moves(self) -> List[GameMove]:
-        sequence: List[GameMove] = []
-        known_moves: Set[Tuple[int, int]] = set()
+    @property
+    def stale(self) -> bool:
+        """ Whether the in-memory game may not match the database anymore, i.e., the game must be reloaded """
+        return self._stale
+
+    @property
+    def lock(self) -> RLock:
+        """ The lock to hold while using this game, as the cached instance is shared by the threads of this worker """
+        return self._lock
+
+    @property
+    def engine(self) -> BoardEngine:
+        """ The board engine, loaded on the first access """
+        if self._engine is None:
+            self._engine = self._load_engine()
+        return self._engine
+
+    @property
+    def board(self) -> Board:
+        return self.engine.board
+
+    def _load_engine(self) -> BoardEngine:
+        square_states = self._info.squareStates
+
+        if square_states is None:
+            # The session was created before the board state was materialized.
+            self.rebuild_board()
+            return self._engine
+
+        with measure('load'):
+            return BoardEngine(self._assemble_board(bytes(square_states)),
+                               **{attribute_name: getattr(self._info, field_name)
+                                  for field_name, attribute_name in _COUNTERS})
+
+    def _assemble_board(self, square_states: Optional[bytes]) -> Board:
+        width = self._info.width
+        height = self._info.height
+
+        mine_flags = unpack_bits(bytes(self._info.mineBitset), width * height)
+
+        nearby_mine_counts = self._info.nearbyMineCounts
 
-        result: Iterable[GameMove] = GameMove.objects.filter(gameId=self._info.id).order_by('-id')
+        if nearby_mine_counts is None:
+            # The session was created before the hints were precomputed.
+            nearby_mine_counts = compute_nearby_mine_counts(width, height, mine_flags)
+            self._info.nearbyMineCounts = nearby_mine_counts
+            self._info.save(update_fields=['nearbyMineCounts'])
 
-        for move in result:
-            coordinate = move.to_coordinate()
+        return Board.assemble(width, height, mine_flags, bytes(nearby_mine_counts), square_states)
 
-            if coordinate in known_moves:
-                continue
-            else:
-                known_moves.add(coordinate)
-                sequence.append(move)
+    def rebuild_board(self) -> Board:
+        """ Rebuild the materialized board state and the running counters from the move log.
 
-        return sequence
+            Raises StaleGameError, with nothing saved, if the game has been updated since it was loaded. The game must
+            then be reloaded.
+        """
+        unit_of_work = UnitOfWork(self._info, self._info.version)
+        engine = BoardEngine(self._assemble_board(None))
+
+        for move in self._get_moves():
+            if move.state in STATE_CODES:
+                engine.change_state(engine.board.index(move.x, move.y), move.state)
+
+        engine.changed_indexes.clear()
+        self._engine = engine
+        self._copy_counters()
+        self._info.squareStates = engine.board.get_state_codes()
+        unit_of_work.mark_changed('squareStates', *[field_name for field_name, _ in _COUNTERS])
+
+        try:
+            unit_of_work.commit()
+        except StaleGameError:
+            # The in-memory board may not match the database anymore.
+            self._engine = None
+            self._stale = True
+            _game_cache.delete(self._info.id)
+            raise
+
+        return engine.board
+
+    def _copy_counters(self) -> List[str]:
+        """ Copy the running counters from the engine to the session, and return the names of the changed fields """
+        changed_field_names: List[str] = []
+
+        for field_name, attribute_name in _COUNTERS:
+            value = getattr(self._engine, attribute_name)
+
+            if getattr(self._info, field_name) != value:
+                setattr(self._info, field_name, value)
+                changed_field_names.append(field_name)
+
+        return changed_field_names
+
+    def _get_moves(self) -> List[GameMove]:
+        """ Get the latest move of each square """
+        with measure('moves'):
+            result: Iterable[GameMove] = GameMove.objects.filter(gameId=self._info.id).latest_per_square() \
+                .order_by('-id')
+            return list(result)
 
     def _get_hints(self) -> Hint:
-        hint = Hint(
-            # Fill in the blank
-            nearby_mine_count=[
-                [0 for _ in range(self._info.width)]
-                for __ in range(self._info.height)
-            ],
-        )
+        with measure('hints'):
+            return Hint(nearby_mine_count=self.board.get_nearby_mine_count_matrix())
+
+    def _get_hint_json(self) -> bytes:
+        """ Get the encoded hint matrix, which never changes, encoded once per game """
+        if self._hint_json is None:
+            with measure('hints'):
+                self._hint_json = snapshot_json.encode_hint_matrix(self.board)
+        return self._hint_json
+
+    def visit_all(self, moves: List[GameMove]) -> bool:
+        """ Apply the moves in order, evaluate the game once, and save all changes in one transaction.
 
-        for mine_position in self._mine_positions:
-            column = mine_position[0]
-            row = mine_position[1]
-            for y in range(max(0, row - 1), min(self._info.height, row + 2)):
-                for x in range(max(0, column - 1), min(self._info.height, column + 2)):
-                    if (x, y) in self._mine_positions:
-                        continue
-                    hint.nearby_mine_count[y][x] += 1
+            The remaining moves are skipped once the game is concluded. Returns False if the game was already concluded.
 
-        return hint
+            Raises StaleGameError, with nothing saved, if the game has been updated since it was loaded. The game must
+            then be reloaded.
+        """
+        if self._stale:
+            raise StaleGameError(self._info.id)
 
-    def visit(self, move: GameMove) -> bool:
         if self._info.state in KNOWN_STATES:
             return False
 
-        if move.state == FLAGGED or move.state == UNKNOWN:
-            move.save()
-            self._run_self_evaluate()
-        elif (move.x, move.y) in self._mine_positions:
-            # Update the state of that position.
-            move.state = EXPLODED
-            move.save()
+        # NOTE: Loading the engine may rebuild the board, i.e., make a new version.
+        engine = self.engine
+
+        # Only track the changes made by these moves.
+        self._base_version = self._info.version
+        engine.changed_indexes.clear()
+        unit_of_work = UnitOfWork(self._info, self._base_version)
+
+        try:
+            with measure('engine'):
+                for move in moves:
+                    for index, state in engine.apply(engine.board.index(move.x, move.y), move.state):
+                        x, y = engine.board.coordinate(index)
+                        unit_of_work.add_move(GameMove(gameId=self._info.id,
+                                                       userId=move.userId,
+                                                       x=x,
+                                                       y=y,
+                                                       state=state,
+                                                       createTime=move.createTime))
+
+                    if engine.evaluate() in KNOWN_STATES:
+                        break
+
             # Update the state of the game.
-            self._info.state = EXPLODED
-            self._info.save()
-        else:
-            visited_coordinates: List[Tuple[int, int]] = list()
-            self._clear_area(move.x, move.y, visited_coordinates)
-            self._run_self_evaluate()
+            self._run_self_evaluate(unit_of_work)
+        except Exception:
+            # The in-memory board may not match the database anymore.
+            self._engine = None
+            self._stale = True
+            _game_cache.delete(self._info.id)
+            raise
 
         return True
 
-    def _clear_area(self, x: int, y: int, visited_coordinates: List[Tuple[int, int]], depth: int = 0):
-        coordinate = (x, y)
-        move: Optional[GameMove] = self._moves.get(coordinate)
+    def _run_self_evaluate(self, unit_of_work: UnitOfWork):
+        unit_of_work.mark_changed(*self._copy_counters())
 
-        # Evaluate the given coordinate.
-        if coordinate in visited_coordinates \
-                or coordinate in self._mine_positions \
-                or (move and move.state in KNOWN_STATES):
-            return
+        state = self._engine.evaluate()
 
-        visited_coordinates.append(coordinate)
+        if state != self._info.state:
+            self._info.state = state
+            unit_of_work.mark_changed('state')
 
-        if move:
-            move.state = CLEARED
-        else:
-            move = GameMove(
-                gameId=self._info.id,
-                userId=self._info.userId,
-                x=x,
-                y=y,
-                state=CLEARED,
-                createTime=math.floor(time()),
-            )
-        move.save()
-
-        # Evaluate the surrounding coordinates.
-        if x - 1 >= 0:
-            self._clear_area(x - 1, y, visited_coordinates, depth + 1)
-
-        if x + 1 < self._info.width:
-            self._clear_area(x + 1, y, visited_coordinates, depth + 1)
-
-        if y - 1 >= 0:
-            self._clear_area(x, y - 1, visited_coordinates, depth + 1)
-
-        if y + 1 < self._info.height:
-            self._clear_area(x, y + 1, visited_coordinates, depth + 1)
-
-    def _run_self_evaluate(self):
-        self._info.state = self._compute_game_state()
-        self._info.save()
-
-    def _compute_game_state(self):
-        cleared_count = 0
-        correctly_flagged_count = 0
-
-        for coordinate, move in self._moves.items():
-            if move.state == CLEARED:
-                cleared_count += 1
-            elif move.state == FLAGGED:
-                if coordinate in self._mine_positions:
-                    correctly_flagged_count += 1
-                else:
-                    cleared_count += 1
-            elif move.state == EXPLODED:
-                return EXPLODED
-            # end: if
-        # end: for
-
-        total_square_count = self._info.width * self._info.height
-        if cleared_count + correctly_flagged_count == total_square_count:
-            return CLEARED
-        else:
-            return ACTIVE
+        if self._engine.changed_indexes:
+            self._info.squareStates = self._engine.board.get_state_codes()
+            unit_of_work.mark_changed('squareStates')
+
+        unit_of_work.commit()
 
     def get_snapshot(self) -> GameSnapshot:
-        return GameSnapshot(
-            info=GameInfo.make(self.info),
-            moves=[
-                SimplifiedMove(x=move.x, y=move.y, state=move.state)
-                for move in self._get_moves()
-            ],
-            hint=self._get_hints(),
-        )
+        hint = self._get_hints()
+
+        with measure('serialize'):
+            moves: List[SimplifiedMove] = []
+
+            for index, state in self.board.iterate_touched_squares():
+                x, y = self.board.coordinate(index)
+                moves.append(SimplifiedMove(x=x, y=y, state=state))
+
+            return GameSnapshot(
+                info=GameInfo.make(self.info),
+                moves=moves,
+                hint=hint,
+            )
+
+    def get_snapshot_json(self) -> bytes:
+        """ Get the snapshot encoded as JSON, the same as the JSON response of get_snapshot() but much faster """
+        hint_json = self._get_hint_json()
+
+        with measure('serialize'):
+            return snapshot_json.encode_snapshot(GameInfo.make(self.info).model_dump(), self.board, hint_json)
+
+    def get_delta(self) -> GameDelta:
+        """ Get the changes made by the last visit, i.e., the last call of visit_all """
+        with measure('serialize'):
+            changes: List[ChangedSquare] = []
+
+            for index in sorted(self.engine.changed_indexes):
+                x, y = self.board.coordinate(index)
+                changes.append(ChangedSquare(x=x,
+                                             y=y,
+                                             state=self.board.get_state(index),
+                                             nearby_mine_count=self.board.get_nearby_mine_count(index)))
+
+            return GameDelta(
+                info=GameInfo.make(self.info),
+                base_version=self._base_version,
+                changes=changes,
+            )
+
+    @classmethod
+    async def aload(cls, id: str):
+        """ Load the game, reusing the instance cached by this worker if its board version is still the latest one.
+
+            The version check costs one indexed lookup, so that the changes made by the other workers are never missed.
+            The board itself is only loaded on the first access, i.e., in the engine thread pool.
+        """
+        with measure('load'):
+            return await cls._aload(id)
+
+    @classmethod
+    async def _aload(cls, id: str):
+        game: Optional[Game] = _game_cache.get(id)
+
+        if game is not None:
+            latest_version = await GameSession.objects.filter(id=id).values_list('version', flat=True).afirst()
+
+            if latest_version is not None and latest_version <= game.info.version:
+                # NOTE: The cached version is ahead while a visit of this worker is being committed.
+                return game
+
+            _game_cache.delete(id)
+
+            if latest_version is None:
+                return None  # Deleted by another worker.
+
+        session = await GameSession.objects.filter(id=id).afirst()
+
+        if session is None:
+            return None
+
+        # Concurrent requests must share the same instance, so that their changes are applied one after another.
+        return _game_cache.setdefault(id, cls(session))
 
     @classmethod
-    def with_id(cls, id: str):
-        session = GameSession.objects.get(id=id)
+    def reload(cls, id: str):
+        """ Load the latest game, replacing the instance cached by this worker """
+        session = GameSession.objects.filter(id=id).first()
 
         if session is None:
+            _game_cache.delete(id)
             return None
+
+        game = cls(session)
+        _game_cache.put(id, game)
+
+        return game
+
+
+game_event_broker: GameEventBroker = container.get(GameEventBroker)
+token_service: TokenService = container.get(TokenService)
+
+# The hot games of this worker, keyed by the session ID.
+_game_cache: LRUCache[Game] = LRUCache(GAME_CACHE_SIZE, ttl=GAME_CACHE_TTL)
+
+# The latest encoded (and compressed) packed snapshots as (board version, body), keyed by the session ID and the
+# encoding options, so that each game keeps at most one body per representation.
+_packed_snapshot_cache: LRUCache[Tuple[int, bytes]] = LRUCache(PACKED_SNAPSHOT_CACHE_SIZE)
+
+
+def _wants_packed_snapshot(request: HttpRequest) -> bool:
+    return request.GET.get('format') == 'packed' \
+        or snapshot_codec.CONTENT_TYPE in request.headers.get('accept', '')
+
+
+def _get_snapshot_representation(request: HttpRequest) -> Tuple[str, bool, Optional[str]]:
+    """ Get the representation of the snapshot as (format, run-length encoded, content encoding).
+
+        Raises ValueError with the name of the invalid query parameter.
+    """
+    if _wants_packed_snapshot(request):
+        return ('packed',
+                get_boolean_parameter(request, 'rle'),
+                snapshot_codec.negotiate_content_encoding(request.headers.get('accept-encoding')))
+    else:
+        return 'json', False, None
+
+
+def _respond_packed_snapshot(game: Game, run_length_encoded: bool, content_encoding: Optional[str]) -> HttpResponse:
+    """ Respond with the packed snapshot, reusing the encoded bytes until the board changes """
+    cache_key = (game.info.id, run_length_encoded, content_encoding)
+    version = game.info.version
+
+    cached_entry = _packed_snapshot_cache.get(cache_key)
+
+    if cached_entry is not None and cached_entry[0] == version:
+        body = cached_entry[1]
+    else:
+        with measure('serialize'):
+            body = snapshot_codec.compress(
+                snapshot_codec.encode_packed_snapshot(GameInfo.make(game.info).model_dump(),
+                                                      game.board,
+                                                      run_length_encoded),
+                content_encoding,
+            )
+        # Replace the body of the previous version.
+        _packed_snapshot_cache.put(cache_key, (version, body))
+
+    response = HttpResponse(body, content_type=snapshot_codec.CONTENT_TYPE)
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    patch_vary_headers(response, ['Accept', 'Accept-Encoding'])
+
+    return response
+
+
+def _render_snapshot(game: Game, representation: Tuple[str, bool, Optional[str]]) -> HttpResponse:
+    """ Render the snapshot in the engine thread pool, reloading the game if it is concurrently updated (see _visit) """
+    for _ in range(MAX_VISIT_ATTEMPTS):
+        try:
+            return _render_snapshot_once(game, representation)
+        except StaleGameError:
+            # The game was concurrently updated, e.g., by another worker, while being used by this request.
+            game = Game.reload(game.info.id)
+
+            if game is None:
+                return respond_error(404)
+
+    return respond_error(409, 'conflict/concurrent_update', version=game.info.version)
+
+
+def _render_snapshot_once(game: Game, representation: Tuple[str, bool, Optional[str]]) -> HttpResponse:
+    with game.lock:
+        if game.stale:
+            # A concurrent visit failed to commit, after changing the board of this instance.
+            raise StaleGameError(game.info.id)
+
+        if representation[0] == 'packed':
+            response = _respond_packed_snapshot(game, representation[1], representation[2])
         else:
-            return cls(session)
+            response = respond_encoded_json(game.get_snapshot_json())
+
+        return set_etag(response, make_etag(game.info.id, game.info.version, *representation))
 
 
-def get_snapshot(request: HttpRequest, session_id: str):
+async def get_snapshot(request: HttpRequest, session_id: str):
     if request.method != 'GET':
         return respond_error(405, 'Method not allowed')
 
@@ -231,18 +516,32 @@ def get_snapshot(request: HttpRequest, session_id: str):
     except AccessDeniedError as e:
         return respond_error(403, e.args[0])
 
-    game: Optional[Game] = Game.with_id(session_id)
+    try:
+        representation = _get_snapshot_representation(request)
+    except ValueError as e:
+        return respond_error(400, f'invalid_request/{e.args[0]}')
+
+    if request.headers.get('if-none-match'):
+        # Check the board version with one indexed lookup, before loading the game.
+        session_header = await GameSession.objects.filter(id=session_id).values_list('userId', 'version').afirst()
+
+        if session_header and session_header[0] == user_id:
+            etag = make_etag(session_id, session_header[1], *representation)
+            if is_not_modified(request, etag):
+                return respond_not_modified(etag)
+
+    game: Optional[Game] = await Game.aload(session_id)
 
     if not game:
         return respond_error(404)
     elif game.info.userId != user_id:
         return respond_error(404)  # Fake HTTP 404 to prevent scanning.
-    else:
-        return respond_ok(game.get_snapshot().model_dump())
+
+    return await run_in_engine_pool(_render_snapshot, game, representation)
 
 
 @csrf_exempt
-def visit(request: HttpRequest, session_id: str):
+async def visit(request: HttpRequest, session_id: str):
     if request.method != 'POST':
         return respond_error(405, 'Method not allowed')
 
@@ -253,15 +552,217 @@ def visit(request: HttpRequest, session_id: str):
     except AccessDeniedError as e:
         return respond_error(403, e.args[0])
 
-    game: Optional[Game] = Game.with_id(session_id)
+    game: Optional[Game] = await Game.aload(session_id)
 
     if not game:
         return respond_error(404)
     elif game.info.userId != user_id:
         return respond_error(404)  # Fake HTTP 404 to prevent scanning.
 
+    try:
+        delta = get_boolean_parameter(request, 'delta')
+    except ValueError as e:
+        return respond_error(400, f'invalid_request/{e.args[0]}')
+
     entry = json.loads(request.body)
-    move = GameMove(
+
+    if not _is_valid_move_entry(entry):
+        return respond_error(400, 'invalid_request/move')
+
+    return await run_in_engine_pool(_visit, game, [entry], user_id, delta)
+
+
+@csrf_exempt
+async def visit_batch(request: HttpRequest, session_id: str):
+    """ Apply an ordered list of moves, e.g., {"moves": [{"x": 1, "y": 2, "state": "chord"}, ...]}, in one go """
+    if request.method != 'POST':
+        return respond_error(405, 'Method not allowed')
+
+    try:
+        user_id = get_authorized_user_id(request, 'game')
+    except UnauthenticatedError:
+        return respond_error(401)
+    except AccessDeniedError as e:
+        return respond_error(403, e.args[0])
+
+    game: Optional[Game] = await Game.aload(session_id)
+
+    if not game:
+        return respond_error(404)
+    elif game.info.userId != user_id:
+        return respond_error(404)  # Fake HTTP 404 to prevent scanning.
+
+    try:
+        delta = get_boolean_parameter(request, 'delta')
+    except ValueError as e:
+        return respond_error(400, f'invalid_request/{e.args[0]}')
+
+    request_body = json.loads(request.body)
+    entries = request_body.get('moves') if isinstance(request_body, dict) else None
+
+    if not isinstance(entries, list) or not entries:
+        return respond_error(400, 'invalid_request/moves')
+    elif len(entries) > MAX_BATCH_SIZE:
+        return respond_error(400, 'invalid_request/too_many_moves')
+
+    for index, entry in enumerate(entries):
+        if not _is_valid_move_entry(entry):
+            return respond_error(400, 'invalid_request/move', index=index)
+
+    return await run_in_engine_pool(_visit, game, entries, user_id, delta)
+
+
+def _visit(game: Game, entries: List[Dict[str, Any]], user_id: int, delta: bool) -> HttpResponse:
+    """ Apply the moves and respond with the result, in the engine thread pool
+
+        If the game is concurrently updated, the moves are applied again on the latest game, up to MAX_VISIT_ATTEMPTS
+        times in total.
+    """
+    for _ in range(MAX_VISIT_ATTEMPTS):
+        try:
+            return _visit_once(game, entries, user_id, delta)
+        except StaleGameError:
+            game = Game.reload(game.info.id)
+
+            if game is None:
+                return respond_error(404)
+
+    return respond_error(409, 'conflict/concurrent_update', version=game.info.version)
+
+
+def _visit_once(game: Game, entries: List[Dict[str, Any]], user_id: int, delta: bool) -> HttpResponse:
+    with game.lock:
+        if game.stale:
+            raise StaleGameError(game.info.id)
+
+        if not all(game.board.contains(entry['x'], entry['y']) for entry in entries):
+            return respond_error(400, 'invalid_request/out_of_bounds')
+
+        previous_state = game.info.state
+
+        if not game.visit_all([_make_move(entry, game.info.id, user_id) for entry in entries]):
+            return respond_error(409, f'game_concluded/{game.info.state}')
+
+        game_delta = game.get_delta()
+        _publish_delta(game_delta, previous_state)
+
+        if delta:
+            # Opt-in: only respond with the changed squares.
+            return respond_ok(_dump(game_delta))
+        else:
+            return respond_encoded_json(game.get_snapshot_json())
+
+
+def _publish_delta(game_delta: GameDelta, previous_state: Optional[str]):
+    """ Push the changes to the subscribers of the game, and the new state of the game if it has changed """
+    info = game_delta.info
+
+    game_event_broker.publish(info.id, format_event('delta', game_delta.model_dump_json(), info.version))
+
+    if info.state != previous_state:
+        game_event_broker.publish(info.id, format_event('state', info.model_dump_json(), info.version))
+
+
+async def _stream_events(session_id: str):
+    messages = game_event_broker.subscribe(session_id)
+
+    # Only respond once subscribed, so that the client never misses the changes made after it is connected.
+    yield f'retry: {EVENT_RETRY_INTERVAL}\n\n' + await anext(messages)
+
+    async for message in messages:
+        yield message
+
+
+@csrf_exempt
+async def issue_event_token(request: HttpRequest, session_id: str):
+    """ Issue a short-lived token to subscribe to the events of the game, see subscribe_events """
+    if request.method != 'POST':
+        return respond_error(405, 'Method not allowed')
+
+    try:
+        user_id = get_authorized_user_id(request, 'game')
+    except UnauthenticatedError:
+        return respond_error(401)
+    except AccessDeniedError as e:
+        return respond_error(403, e.args[0])
+
+    owner_id = await GameSession.objects.filter(id=session_id).values_list('userId', flat=True).afirst()
+
+    if owner_id is None or owner_id != user_id:
+        return respond_error(404)  # Fake HTTP 404 to prevent scanning.
+
+    return respond_ok(token_service.generate_event_token(user_id, session_id))
+
+
+def _get_event_subscriber_id(request: HttpRequest, session_id: str) -> int:
+    """ Get the user ID from the event token in the "token" query parameter, or else from the bearer token """
+    event_token = request.GET.get('token')
+
+    if not event_token:
+        return get_authorized_user_id(request, 'game')
+
+    claims = decode_token(event_token)
+
+    if claims is None:
+        raise UnauthenticatedError()
+    elif claims.get('scope') != 'events' or claims.get('gid') != session_id:
+        raise AccessDeniedError('invalid_scope')
+    else:
+        return int(claims['sub'])
+
+
+async def subscribe_events(request: HttpRequest, session_id: str):
+    """ Stream the changes of the game as server-sent events.
+
+        Each "delta" event has the changes made by one visit (see GameDelta), with the new board version as its ID. A
+        "state" event follows when the state of the game changes. A "resync" event means that some events were dropped.
+        The client should fetch the snapshot after connecting, and again whenever the base version of a delta does not
+        match its own board version.
+
+        As the EventSource API of the browsers cannot send the Authorization header, the client may instead get an event
+        token for this game with "POST rpc/events/<id>/token" and subscribe with "rpc/events/<id>?token=<event token>".
+        The event token expires after 5 minutes, so the client must get a new one before reconnecting after that.
+
+        The events are only streamed under ASGI (see is_streaming_supported), and HTTP 501 is returned otherwise.
+    """
+    if request.method != 'GET':
+        return respond_error(405, 'Method not allowed')
+
+    try:
+        user_id = _get_event_subscriber_id(request, session_id)
+    except UnauthenticatedError:
+        return respond_error(401)
+    except AccessDeniedError as e:
+        return respond_error(403, e.args[0])
+
+    owner_id = await GameSession.objects.filter(id=session_id).values_list('userId', flat=True).afirst()
+
+    if owner_id is None or owner_id != user_id:
+        return respond_error(404)  # Fake HTTP 404 to prevent scanning.
+    elif not is_streaming_supported(request):
+        return respond_error(501, 'not_supported/streaming')
+
+    response = StreamingHttpResponse(_stream_events(session_id), content_type='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Disable the buffering of the reverse proxy, if any.
+
+    return response
+
+
+def _dump(model: BaseModel) -> Dict[str, Any]:
+    with measure('serialize'):
+        return model.model_dump()
+
+
+def _is_valid_move_entry(entry: Any) -> bool:
+    """ Check if the entry is a move, i.e., {"x": int, "y": int, "state": optional str} """
+    return isinstance(entry, dict) \
+        and all(type(entry.get(name)) is int for name in ('x', 'y')) \
+        and isinstance(entry.get('state'), (str, type(None)))
+
+
+def _make_move(entry: Dict[str, Any], session_id: str, user_id: int) -> GameMove:
+    return GameMove(
         gameId=session_id,
         userId=user_id,
         x=entry['x'],
@@ -269,8 +770,3 @@ def visit(request: HttpRequest, session_id: str):
         state=entry.get('state'),
         createTime=math.floor(time()),
     )
-
-    if game.visit(move):
-        return respond_ok(game.get_snapshot().model_dump())
-    else:
-        return respond_error(409, f'game_concluded/{game.info.state}')
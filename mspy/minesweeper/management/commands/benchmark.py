@@ -0,0 +1,187 @@
+import json
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from minesweeper.common import snapshot_codec
+from minesweeper.common.board import Board, compute_nearby_mine_counts, pack_bits
+from minesweeper.common.board_engine import BoardEngine
+from minesweeper.common.mine_placement import compute_mine_count, place_mines
+from minesweeper.game_engine import Game, GameInfo
+from minesweeper.models import GameSession
+
+BOARD_SIZES = ['9x9', '16x16', '30x16', '100x100', '500x500', '1000x1000', '2000x2000']
+MINE_DENSITIES = [5, 15, 50, 90]
+CASES = ['place_mines', 'hints', 'reveal', 'evaluate', 'snapshot_json', 'snapshot_fast', 'snapshot_packed']
+
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.25  # The allowed slowdown relative to the baseline, i.e., 25%
+CONFIRMATION_FACTOR = 3  # The suspected regressions are measured again with this many times the runs
+MIN_REGRESSION = 0.001  # in seconds, as the shorter timings are mostly noise
+SEED = 20240101
+
+
+class Fixture:
+    """ One board, generated once per board size and mine density, without any database """
+
+    def __init__(self, width: int, height: int, mine_density: int):
+        self.width = width
+        self.height = height
+        self.mine_density = mine_density
+        self.mine_count = compute_mine_count(width, height, mine_density)
+        self.mine_flags = place_mines(width, height, self.mine_count, seed=SEED)
+        self.nearby_mine_counts = compute_nearby_mine_counts(width, height, self.mine_flags)
+
+        # Reveal from the first square without any nearby mines, i.e., the largest flood, or any safe square.
+        self.origin = next((index for index in range(width * height)
+                            if not self.mine_flags[index] and not self.nearby_mine_counts[index]),
+                           self.mine_flags.find(0))
+
+    def make_board(self) -> Board:
+        return Board.assemble(self.width, self.height, self.mine_flags, self.nearby_mine_counts)
+
+    def make_played_engine(self) -> BoardEngine:
+        engine = BoardEngine(self.make_board())
+        if self.origin >= 0:
+            engine.apply(self.origin, None)
+        return engine
+
+    def make_game(self) -> Game:
+        engine = self.make_played_engine()
+        game = Game(GameSession(id='benchmark',
+                                userId=0,
+                                width=self.width,
+                                height=self.height,
+                                mineDensity=self.mine_density,
+                                createTime=0,
+                                mineBitset=pack_bits(self.mine_flags),
+                                nearbyMineCounts=self.nearby_mine_counts,
+                                squareStates=engine.board.get_state_codes(),
+                                revealedSafeCount=engine.revealed_safe_count))
+        game.board  # Load the board beforehand, as a hot game is cached.
+        return game
+
+
+def _run_case(case: str, fixture: Fixture) -> Tuple[Callable[[], Any], Callable[[Any], Any]]:
+    """ Get the (untimed) setup and the timed function of the case """
+    if case == 'place_mines':
+        return (lambda: None,
+                lambda _: place_mines(fixture.width, fixture.height, fixture.mine_count, seed=SEED))
+    elif case == 'hints':
+        return (lambda: None,
+                lambda _: compute_nearby_mine_counts(fixture.width, fixture.height, fixture.mine_flags))
+    elif case == 'reveal':
+        return (lambda: BoardEngine(fixture.make_board()),
+                lambda engine: engine.apply(fixture.origin, None))
+    elif case == 'evaluate':
+        # What each visit does after applying the moves
+        return (fixture.make_played_engine,
+                lambda engine: (engine.evaluate(), engine.board.get_state_codes()))
+    elif case == 'snapshot_json':
+        encoder = DjangoJSONEncoder()
+        return (fixture.make_game,
+                lambda game: encoder.encode(game.get_snapshot().model_dump()))
+    elif case == 'snapshot_fast':
+        # NOTE: The hint matrix is encoded once per game, as a hot game is cached.
+        return (fixture.make_game,
+                lambda game: game.get_snapshot_json())
+    elif case == 'snapshot_packed':
+        return (fixture.make_game,
+                lambda game: snapshot_codec.encode_packed_snapshot(GameInfo.make(game.info).model_dump(),
+                                                                   game.board,
+                                                                   False))
+    else:
+        raise CommandError(f'Unknown case: {case}')
+
+
+def _measure(setup: Callable[[], Any], func: Callable[[Any], Any], repeat: int) -> float:
+    """ Get the best time of the runs, in seconds """
+    best: Optional[float] = None
+
+    for _ in range(repeat):
+        subject = setup()
+        start_time = perf_counter()
+        func(subject)
+        elapsed_time = perf_counter() - start_time
+        best = elapsed_time if best is None else min(best, elapsed_time)
+
+    return best
+
+
+def _is_regression(best: float, baseline: float, tolerance: float) -> bool:
+    return best > baseline * (1 + tolerance) and best - baseline > MIN_REGRESSION
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the hot paths of the board engine against the baselines of this machine (no database required)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', default=BOARD_SIZES, help='The board sizes as WIDTHxHEIGHT')
+        parser.add_argument('--densities', nargs='+', type=int, default=MINE_DENSITIES, help='The mine densities (%%)')
+        parser.add_argument('--cases', nargs='+', choices=CASES, default=CASES)
+        parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                            help='The number of runs per case (the best one counts)')
+        parser.add_argument('--baselines', default=str(Path(settings.BASE_DIR) / 'benchmarks' / 'baselines.json'),
+                            help='The baselines recorded on this machine (not under version control)')
+        parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                            help='The allowed slowdown relative to the baseline, e.g., 0.25 for 25%%')
+        parser.add_argument('--update-baselines', action='store_true',
+                            help='Store the results as the new baselines instead of checking for regressions')
+
+    def handle(self, *args, **options):
+        baseline_path = Path(options['baselines'])
+        baselines: Dict[str, float] = json.loads(baseline_path.read_text()) if baseline_path.exists() else dict()
+        results: Dict[str, float] = dict()
+        regressions: List[str] = []
+
+        self.stdout.write(f'{"benchmark":<36} {"best (ms)":>12} {"baseline (ms)":>14} {"change":>8}')
+
+        for size in options['sizes']:
+            width, height = (int(length) for length in size.lower().split('x'))
+
+            for mine_density in options['densities']:
+                fixture = Fixture(width, height, mine_density)
+
+                for case in options['cases']:
+                    key = f'{case}/{width}x{height}/{mine_density}%'
+                    best = _measure(*_run_case(case, fixture), repeat=options['repeat'])
+                    baseline = baselines.get(key)
+
+                    if baseline is None:
+                        results[key] = best
+                        self.stdout.write(f'{key:<36} {best * 1000:>12.3f} {"-":>14} {"-":>8}')
+                        continue
+
+                    if _is_regression(best, baseline, options['tolerance']):
+                        # NOTE: Confirm with more runs, as one busy moment of the machine slows down all runs of a
+                        #       short case at once.
+                        best = min(best, _measure(*_run_case(case, fixture),
+                                                  repeat=options['repeat'] * CONFIRMATION_FACTOR))
+
+                    results[key] = best
+                    change = f'{(best - baseline) / baseline:+.0%}' if baseline else '-'
+                    line = f'{key:<36} {best * 1000:>12.3f} {baseline * 1000:>14.3f} {change:>8}'
+
+                    if _is_regression(best, baseline, options['tolerance']):
+                        regressions.append(key)
+                        self.stdout.write(self.style.ERROR(line))
+                    else:
+                        self.stdout.write(line)
+
+        if options['update_baselines']:
+            baselines.update(results)
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Stored {len(results)} baseline(s) in {baseline_path}'))
+        elif not baselines:
+            self.stdout.write(self.style.WARNING(f'No baselines in {baseline_path}, record them on this machine '
+                                                 'with --update-baselines'))
+        elif regressions:
+            raise CommandError(f'{len(regressions)} regression(s) beyond {options["tolerance"]:.0%}: '
+                               + ', '.join(regressions))
+        else:
+            self.stdout.write(self.style.SUCCESS('No regressions'))
@@ -0,0 +1,353 @@
+import json
+import math
+import random
+import re
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from uuid import uuid4
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from imagination import container
+
+from minesweeper.common.token_service import TokenService
+from minesweeper.models import GameMove, GameSession
+
+# The query count in the Server-Timing header (see ServerTimingMiddleware)
+_QUERY_COUNT_PATTERN = re.compile(r'\bdb;dur=[0-9.]+;desc="([0-9]+) queries"')
+
+
+def _use_sqlite(path: str):
+    """ Switch the default database to a migrated SQLite database """
+    connections.close_all()
+    connections.settings['default'] = connections.configure_settings({
+        'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path},
+    })['default']
+    del connections['default']
+
+    call_command('migrate', verbosity=0)
+
+
+def _percentile(sorted_values: List[float], percentage: float) -> float:
+    """ Nearest-rank percentile """
+    return sorted_values[max(0, math.ceil(len(sorted_values) * percentage / 100) - 1)]
+
+
+class Response:
+    def __init__(self, status: int, body: bytes, etag: Optional[str], server_timing: Optional[str]):
+        self.status = status
+        self.body = body
+        self.etag = etag
+
+        match = _QUERY_COUNT_PATTERN.search(server_timing) if server_timing else None
+        self.query_count = int(match.group(1)) if match else None
+
+    def json(self) -> Any:
+        return json.loads(self.body) if self.body else None
+
+
+class TestClientTransport:
+    """ Send the requests through the URLconf in this process """
+
+    def __init__(self):
+        self._client = Client(raise_request_exception=False)
+
+    def request(self, method: str, path: str, token: str, body: Any = None,
+                headers: Optional[Dict[str, str]] = None) -> Response:
+        response = self._client.generic(method,
+                                        path,
+                                        json.dumps(body) if body is not None else '',
+                                        content_type='application/json',
+                                        headers={'Authorization': f'Bearer {token}', **(headers or {})})
+
+        return Response(response.status_code,
+                        response.content,
+                        response.headers.get('ETag'),
+                        response.headers.get('Server-Timing'))
+
+
+class HttpTransport:
+    """ Send the requests to a running server, e.g., "http://127.0.0.1:8000" """
+
+    def __init__(self, base_url: str):
+        self._base_url = base_url.rstrip('/')
+
+    def request(self, method: str, path: str, token: str, body: Any = None,
+                headers: Optional[Dict[str, str]] = None) -> Response:
+        request = Request(self._base_url + path,
+                          data=json.dumps(body).encode() if body is not None else None,
+                          method=method,
+                          headers={'Authorization': f'Bearer {token}',
+                                   'Content-Type': 'application/json',
+                                   **(headers or {})})
+
+        try:
+            with urlopen(request) as response:
+                return Response(response.status,
+                                response.read(),
+                                response.headers.get('ETag'),
+                                response.headers.get('Server-Timing'))
+        except HTTPError as e:
+            return Response(e.code, e.read(), e.headers.get('ETag'), e.headers.get('Server-Timing'))
+
+
+class Recorder:
+    """ Collect the latency, the status and the query count of every request, per endpoint """
+
+    def __init__(self):
+        self._samples: Dict[str, List[Tuple[float, int, Optional[int]]]] = dict()
+        self._lock = Lock()
+
+    def record(self, endpoint: str, latency: float, response: Response):
+        with self._lock:
+            self._samples.setdefault(endpoint, []).append((latency, response.status, response.query_count))
+
+    def summarize(self, elapsed_time: float) -> List[Dict[str, Any]]:
+        summaries: List[Dict[str, Any]] = []
+
+        for endpoint, samples in sorted(self._samples.items()):
+            latencies = sorted(latency for latency, _, _ in samples)
+            query_counts = [query_count for _, _, query_count in samples if query_count is not None]
+
+            summaries.append(dict(
+                endpoint=endpoint,
+                requests=len(samples),
+                errors=sum(1 for _, status, _ in samples if status >= 500),
+                throughput=len(samples) / elapsed_time,
+                p50=_percentile(latencies, 50),
+                p95=_percentile(latencies, 95),
+                p99=_percentile(latencies, 99),
+                queries=sum(query_counts) / len(query_counts) if query_counts else None,
+            ))
+
+        return summaries
+
+
+class Player:
+    """ One simulated player, who creates games, clicks, flags and polls the snapshot """
+
+    def __init__(self, transport, recorder: Recorder, token: str, rng: random.Random, options: Dict[str, Any]):
+        self._transport = transport
+        self._recorder = recorder
+        self._token = token
+        self._rng = rng
+        self._options = options
+
+    def _send(self, endpoint: str, method: str, path: str, body: Any = None,
+              headers: Optional[Dict[str, str]] = None) -> Response:
+        start_time = perf_counter()
+        response = self._transport.request(method, path, self._token, body, headers)
+        self._recorder.record(endpoint, perf_counter() - start_time, response)
+        return response
+
+    def _visit(self, session_id: str, x: int, y: int, state: Optional[str]) -> Response:
+        return self._send('POST /api/rpc/visit/<id>', 'POST', f'/api/rpc/visit/{session_id}?delta=1',
+                          dict(x=x, y=y, state=state))
+
+    def _poll(self, session_id: str, etag: Optional[str]) -> Response:
+        return self._send('GET /api/rpc/snapshot/<id>', 'GET', f'/api/rpc/snapshot/{session_id}',
+                          headers={'If-None-Match': etag} if etag else None)
+
+    def play(self):
+        width = self._options['width']
+        height = self._options['height']
+
+        for _ in range(self._options['games']):
+            response = self._send('POST /api/games/', 'POST', '/api/games/',
+                                  dict(width=width, height=height, mineDensity=self._options['density']))
+
+            if response.status != 200:
+                continue
+
+            session_id = response.json()['id']
+            untouched: Set[Tuple[int, int]] = {(x, y) for x in range(width) for y in range(height)}
+            etag: Optional[str] = None
+
+            for move_number in range(1, self._options['moves'] + 1):
+                if not untouched:
+                    break
+
+                x, y = self._rng.choice(tuple(untouched))
+                state = 'flagged' if self._rng.random() < self._options['flag_ratio'] else None
+                response = self._visit(session_id, x, y, state)
+
+                if response.status != 200:
+                    break  # e.g., the game is concluded.
+
+                delta = response.json()
+                untouched.difference_update((change['x'], change['y']) for change in delta['changes'])
+
+                if move_number % self._options['poll_every'] == 0:
+                    etag = self._poll(session_id, etag).etag or etag
+
+                if delta['info']['state'] != 'active':
+                    break
+
+    def replay(self, session_id: str, moves: List[Tuple[int, int, str]]):
+        """ Replay the move log of a game, skipping the squares already revealed by the previous moves """
+        known: Dict[Tuple[int, int], str] = dict()
+
+        for x, y, state in moves:
+            if state in ('cleared', 'exploded'):
+                if (x, y) in known and known[(x, y)] != 'unknown':
+                    continue  # Revealed by the flood of an earlier click.
+                state = None
+
+            response = self._visit(session_id, x, y, state)
+
+            if response.status != 200:
+                break
+
+            delta = response.json()
+            known.update(((change['x'], change['y']), change['state']) for change in delta['changes'])
+
+            if delta['info']['state'] != 'active':
+                break
+
+
+class Command(BaseCommand):
+    help = 'Drive simulated players through the API and report the throughput, latency and query counts per endpoint'
+
+    # NOTE: The query counts are taken from the Server-Timing header, i.e., only if ServerTimingMiddleware is enabled.
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=10)
+        parser.add_argument('--threads', type=int, default=1,
+                            help='The number of concurrent threads sharing the players (use 1 with SQLite)')
+        parser.add_argument('--games', type=int, default=2, help='The number of games per player')
+        parser.add_argument('--moves', type=int, default=30, help='The maximum number of moves per game')
+        parser.add_argument('--poll-every', type=int, default=5, help='Poll the snapshot every N moves')
+        parser.add_argument('--flag-ratio', type=float, default=0.1)
+        parser.add_argument('--width', type=int, default=16)
+        parser.add_argument('--height', type=int, default=16)
+        parser.add_argument('--density', type=int, default=15)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--url', help='Send real HTTP requests to this server instead of using the test client')
+        parser.add_argument('--sqlite', metavar='PATH',
+                            help='Run against this (migrated) SQLite database instead of the configured one')
+        parser.add_argument('--replay', nargs='*', metavar='SESSION_ID',
+                            help='Replay the recorded moves of these game sessions (default: the latest ones)')
+        parser.add_argument('--replay-limit', type=int, default=10,
+                            help='The number of latest game sessions to replay if no session ID is given')
+
+    def handle(self, *args, **options):
+        if options['url'] and options['sqlite']:
+            raise CommandError('--sqlite only applies to the test client')
+
+        # Read the move logs before switching the database, e.g., to replay the production logs against SQLite.
+        replay_logs = self._load_replay_logs(options) if options['replay'] is not None else None
+
+        if options['sqlite']:
+            _use_sqlite(options['sqlite'])
+
+        if options['url']:
+            transport_factory = lambda: HttpTransport(options['url'])
+        else:
+            setup_test_environment(debug=False)
+            transport_factory = TestClientTransport
+
+        try:
+            recorder = Recorder()
+            players = self._make_players(transport_factory, recorder, options)
+            tasks = self._make_tasks(players, replay_logs, options)
+            batches = [tasks[index::options['threads']] for index in range(options['threads'])]
+
+            start_time = perf_counter()
+            threads = [Thread(target=self._run_tasks, args=(batch,)) for batch in batches if batch]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed_time = perf_counter() - start_time
+        finally:
+            if not options['url']:
+                teardown_test_environment()
+
+        self._report(recorder.summarize(elapsed_time), elapsed_time)
+
+    def _load_replay_logs(self, options) -> List[Tuple[GameSession, List[Tuple[int, int, str]]]]:
+        sessions = GameSession.objects.all()
+
+        if options['replay']:
+            sessions = sessions.filter(id__in=options['replay'])
+        else:
+            sessions = sessions.order_by('-createTime')[:options['replay_limit']]
+
+        return [
+            (session, list(GameMove.objects.filter(gameId=session.id).order_by('id').values_list('x', 'y', 'state')))
+            for session in sessions
+        ]
+
+    def _make_players(self, transport_factory, recorder: Recorder, options) -> List[Player]:
+        token_service: TokenService = container.get(TokenService)
+        seed_rng = random.Random(options['seed'])
+        players: List[Player] = []
+
+        for index in range(options['players']):
+            user, _ = User.objects.get_or_create(username=f'loadtest-{index}')
+            players.append(Player(transport_factory(),
+                                  recorder,
+                                  token_service.generate_tokens(user)['access_token'],
+                                  random.Random(seed_rng.random()),
+                                  options))
+
+        return players
+
+    def _make_tasks(self, players: List[Player], replay_logs, options) -> List[Tuple[Any, ...]]:
+        if replay_logs is None:
+            return [(player.play,) for player in players]
+
+        if options['url']:
+            raise CommandError('The recorded games can only be replayed with the test client')
+
+        tasks: List[Tuple[Any, ...]] = []
+
+        for index, (session, moves) in enumerate(replay_logs):
+            player = players[index % len(players)]
+
+            # Replay on a copy of the game, with the same mines, owned by the player.
+            replayed_session = GameSession.objects.create(
+                id=str(uuid4()),
+                userId=User.objects.get(username=f'loadtest-{index % len(players)}').id,
+                width=session.width,
+                height=session.height,
+                mineDensity=session.mineDensity,
+                createTime=session.createTime,
+                mineBitset=session.mineBitset,
+                nearbyMineCounts=session.nearbyMineCounts,
+                squareStates=bytes(session.width * session.height),
+            )
+
+            tasks.append((player.replay, replayed_session.id, moves))
+
+        return tasks
+
+    @staticmethod
+    def _run_tasks(tasks: List[Tuple[Any, ...]]):
+        try:
+            for func, *args in tasks:
+                func(*args)
+        finally:
+            connections.close_all()
+
+    def _report(self, summaries: List[Dict[str, Any]], elapsed_time: float):
+        total_requests = sum(summary['requests'] for summary in summaries)
+
+        self.stdout.write(f'{"endpoint":<28} {"requests":>8} {"errors":>6} {"req/s":>8} '
+                          f'{"p50 (ms)":>9} {"p95 (ms)":>9} {"p99 (ms)":>9} {"queries":>8}')
+
+        for summary in summaries:
+            queries = f'{summary["queries"]:.1f}' if summary['queries'] is not None else '-'
+            self.stdout.write(f'{summary["endpoint"]:<28} {summary["requests"]:>8} {summary["errors"]:>6} '
+                              f'{summary["throughput"]:>8.1f} {summary["p50"] * 1000:>9.1f} '
+                              f'{summary["p95"] * 1000:>9.1f} {summary["p99"] * 1000:>9.1f} {queries:>8}')
+
+        self.stdout.write(self.style.SUCCESS(f'{total_requests} request(s) in {elapsed_time:.2f}s '
+                                             f'({total_requests / elapsed_time:.1f} req/s)'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from minesweeper.game_engine import Game, StaleGameError
+from minesweeper.models import GameSession
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized board states and the running counters of the game sessions from the move log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('session_ids', nargs='*', help='The game session IDs (default: all sessions)')
+
+    def handle(self, *args, **options):
+        sessions = GameSession.objects.all()
+
+        if options['session_ids']:
+            sessions = sessions.filter(id__in=options['session_ids'])
+
+        rebuilt_count = 0
+
+        for session in sessions.iterator():
+            try:
+                Game(session).rebuild_board()
+                rebuilt_count += 1
+            except StaleGameError:
+                self.stdout.write(self.style.WARNING(f'Skipped {session.id}, as it was updated meanwhile'))
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt_count} board state(s)'))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('minesweeper', '0004_alter_gamesession_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='nearbyMineCounts',
+            field=models.BinaryField(db_column='nearby_mine_counts', null=True),
+        ),
+        migrations.AlterField(
+            model_name='gamesession',
+            name='id',
+            field=models.CharField(default='7994c761-1b43-45b4-a8e1-1045dc3c22a9', primary_key=True, serialize=False),
+        ),
+    ]
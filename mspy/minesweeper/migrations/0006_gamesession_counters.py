@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:11
+
+from django.db import migrations, models
+
+
+def backfill_counters(apps, schema_editor):
+    GameSession = apps.get_model('minesweeper', 'GameSession')
+    GameMove = apps.get_model('minesweeper', 'GameMove')
+
+    for session in GameSession.objects.all().iterator():
+        mine_positions = {(c['x'], c['y']) for c in session.mineCoordinates}
+        known_coordinates = set()
+
+        for move in GameMove.objects.filter(gameId=session.id).order_by('-id').iterator():
+            coordinate = (move.x, move.y)
+
+            if coordinate in known_coordinates:
+                continue
+            known_coordinates.add(coordinate)
+
+            if move.state == 'cleared':
+                session.revealedSafeCount += 1
+            elif move.state == 'flagged':
+                if coordinate in mine_positions:
+                    session.correctFlagCount += 1
+                else:
+                    session.wrongFlagCount += 1
+            elif move.state == 'exploded':
+                session.exploded = True
+        # end: for
+
+        session.save(update_fields=['revealedSafeCount', 'correctFlagCount', 'wrongFlagCount', 'exploded'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('minesweeper', '0005_gamesession_nearby_mine_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='correctFlagCount',
+            field=models.IntegerField(db_column='correct_flag_count', default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='gamesession',
+            name='exploded',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='gamesession',
+            name='revealedSafeCount',
+            field=models.IntegerField(db_column='revealed_safe_count', default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='gamesession',
+            name='wrongFlagCount',
+            field=models.IntegerField(db_column='wrong_flag_count', default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='gamesession',
+            name='id',
+            field=models.CharField(default='41ec8e0e-863f-4e66-a68d-660902068404', primary_key=True, serialize=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
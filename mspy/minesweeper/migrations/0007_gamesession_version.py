@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('minesweeper', '0006_gamesession_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='gamesession',
+            name='id',
+            field=models.CharField(default='cbf16b83-bf5f-4a2a-b74a-7db434ba8664', primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:13
+
+from django.db import migrations, models
+
+
+def convert_mine_coordinates_to_bitset(apps, schema_editor):
+    GameSession = apps.get_model('minesweeper', 'GameSession')
+
+    for session in GameSession.objects.all().iterator():
+        bitset = bytearray((session.width * session.height + 7) // 8)
+        for coordinate in session.mineCoordinates:
+            index = coordinate['y'] * session.width + coordinate['x']
+            bitset[index // 8] |= 1 << (index % 8)
+        session.mineBitset = bytes(bitset)
+        session.save(update_fields=['mineBitset'])
+
+
+def convert_bitset_to_mine_coordinates(apps, schema_editor):
+    GameSession = apps.get_model('minesweeper', 'GameSession')
+
+    for session in GameSession.objects.all().iterator():
+        bitset = bytes(session.mineBitset or b'')
+        session.mineCoordinates = [
+            dict(x=index % session.width, y=index // session.width)
+            for index in range(min(len(bitset) * 8, session.width * session.height))
+            if bitset[index // 8] & (1 << (index % 8))
+        ]
+        session.save(update_fields=['mineCoordinates'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('minesweeper', '0007_gamesession_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='mineBitset',
+            field=models.BinaryField(db_column='mine_bitset', null=True),
+        ),
+        migrations.RunPython(convert_mine_coordinates_to_bitset, convert_bitset_to_mine_coordinates),
+        migrations.RemoveField(
+            model_name='gamesession',
+            name='mineCoordinates',
+        ),
+        migrations.AlterField(
+            model_name='gamesession',
+            name='id',
+            field=models.CharField(default='9acd2a04-6bf4-4c4e-a530-95fb653e6235', primary_key=True, serialize=False),
+        ),
+    ]
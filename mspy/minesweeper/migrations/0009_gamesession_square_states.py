@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('minesweeper', '0008_gamesession_mine_bitset'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='squareStates',
+            field=models.BinaryField(db_column='square_states', null=True),
+        ),
+        migrations.AlterField(
+            model_name='gamesession',
+            name='id',
+            field=models.CharField(default='2f4025c2-c2ba-49b0-b774-527d6ded9a2e', primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('minesweeper', '0009_gamesession_square_states'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='gamesession',
+            name='id',
+            field=models.CharField(default='afe50056-d0d7-4c7e-8c8b-bb19e83c0e54', primary_key=True, serialize=False),
+        ),
+        migrations.AddIndex(
+            model_name='gamemove',
+            index=models.Index(fields=['gameId', 'x', 'y', '-id'], name='game_move_latest_idx'),
+        ),
+    ]
@@ -1,7 +1,8 @@
 from time import time
 from typing import Tuple
 from uuid import uuid4
-from django.db import models
+from django.db import connections, models
+from django.db.models import Max
 
 
 class GameSession(models.Model):
@@ -11,16 +12,49 @@ class GameSession(models.Model):
     height = models.IntegerField(null=False)  # in square
     mine_density = models.SmallIntegerField(db_column='mine_density', name='mineDensity',
                                             null=False)  # Used to initially calculate the number of mines.
-    mine_coordinates = models.JSONField(db_column='mine_coordinates', name='mineCoordinates',
-                                        default=list)  # The position of the mines as an array of {x: int, y: int}.
+    mine_bitset = models.BinaryField(db_column='mine_bitset', name='mineBitset',
+                                     null=True)  # One bit per square, indexed by "y * width + x". See board.pack_bits.
+    nearby_mine_counts = models.BinaryField(db_column='nearby_mine_counts', name='nearbyMineCounts',
+                                            null=True)  # One byte per square, indexed by "y * width + x".
     state = models.CharField(null=True)
     create_time = models.IntegerField(db_column='create_time', name='createTime', null=False, db_index=True,
                                       default=time)
 
+    # The latest state code of every square (one byte per square, indexed by "y * width + x"), materialized from the
+    # move log and updated in the same transaction as each move.
+    square_states = models.BinaryField(db_column='square_states', name='squareStates', null=True)
+
+    # Running counters of the latest state of all squares, maintained by the game engine on every move.
+    # NOTE: They are not editable so that they are never exposed by the REST API, e.g., the correct flag count.
+    revealed_safe_count = models.IntegerField(db_column='revealed_safe_count', name='revealedSafeCount',
+                                              null=False, default=0, editable=False)
+    correct_flag_count = models.IntegerField(db_column='correct_flag_count', name='correctFlagCount',
+                                             null=False, default=0, editable=False)
+    wrong_flag_count = models.IntegerField(db_column='wrong_flag_count', name='wrongFlagCount',
+                                           null=False, default=0, editable=False)
+    exploded = models.BooleanField(null=False, default=False, editable=False)
+    version = models.IntegerField(null=False, default=0)  # The board version, increased on every move.
+
+
+class GameMoveQuerySet(models.QuerySet):
+    def latest_per_square(self):
+        """ Only keep the latest move of each square (per game), deduplicated by the database.
+
+            On PostgreSQL, this uses "DISTINCT ON (game_id, x, y)" backed by the "game_move_latest_idx" index.
+        """
+        if connections[self.db].vendor == 'postgresql':
+            latest_ids = self.order_by('gameId', 'x', 'y', '-id').distinct('gameId', 'x', 'y').values('id')
+        else:
+            latest_ids = self.order_by().values('gameId', 'x', 'y').annotate(latest_id=Max('id')).values('latest_id')
+
+        return self.model.objects.using(self.db).filter(id__in=latest_ids)
+
 
 class GameMove(models.Model):
     """ Game Move DB Model
 
+        This is the append-only log of all moves. The current state of the board is materialized in GameSession.
+
         The foreign keys (game_id, user_id) are not set on purpose for the sake of simplcity and performance.
     """
     game_id = models.CharField(db_column='game_id', name='gameId', db_index=True, null=False)
@@ -32,6 +66,14 @@ class GameMove(models.Model):
     create_time = models.IntegerField(db_column='create_time', name='createTime', null=False, db_index=True,
                                       default=time)
 
+    objects = GameMoveQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # For looking up the latest move of each square.
+            models.Index(fields=['gameId', 'x', 'y', '-id'], name='game_move_latest_idx'),
+        ]
+
     def to_coordinate(self) -> Tuple[int, int]:
         # noinspection PyTypeChecker
         return self.x, self.y
@@ -1,3 +1,588 @@
-from django.test import TestCase
+import json
+import random
+from threading import Thread
+from typing import Any, Dict, Iterable, List, Tuple
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.http import JsonResponse
+from django.test import Client, SimpleTestCase, TransactionTestCase
+from imagination import container
+
+from minesweeper import game_engine, views
+from minesweeper.common import snapshot_codec
+from minesweeper.common.board import Board, compute_nearby_mine_counts, pack_bits, unpack_bits
+from minesweeper.common.board_engine import ACTIVE, BoardEngine, CHORD, CLEARED, EXPLODED, FLAGGED, UNKNOWN
+from minesweeper.common.mine_placement import compute_mine_count, place_mines
+from minesweeper.common.reveal_engine import _search_area, get_chord_targets, reveal_area
+from minesweeper.common.token_service import TokenService
+from minesweeper.game_engine import Game, GameInfo, StaleGameError
+from minesweeper.models import GameMove, GameSession
+
+
+def _make_board(width: int, height: int, mine_positions: Iterable[Tuple[int, int]]) -> Board:
+    return Board.make(width, height, mine_positions)
+
+
+def _make_random_board(width: int, height: int, mine_density: int, seed: int) -> Board:
+    mine_flags = place_mines(width, height, compute_mine_count(width, height, mine_density), seed=seed)
+    return Board.assemble(width, height, mine_flags, compute_nearby_mine_counts(width, height, mine_flags))
+
+
+def _count_nearby_mines(width: int, height: int, mine_flags: bytes) -> List[int]:
+    """ The reference implementation, one square at a time """
+    counts: List[int] = []
+
+    for y in range(height):
+        for x in range(width):
+            if mine_flags[y * width + x]:
+                counts.append(0)
+                continue
+
+            counts.append(sum(mine_flags[ny * width + nx]
+                              for ny in range(max(0, y - 1), min(height, y + 2))
+                              for nx in range(max(0, x - 1), min(width, x + 2))))
+
+    return counts
+
+
+def _make_game(board: Board, engine: BoardEngine) -> Game:
+    """ Make a game from the board, without any database """
+    game = Game(GameSession(id='test',
+                            userId=0,
+                            width=board.width,
+                            height=board.height,
+                            mineDensity=0,
+                            createTime=0,
+                            mineBitset=pack_bits(bytes(1 if board.is_mine(index) else 0
+                                                       for index in range(board.size))),
+                            nearbyMineCounts=board.get_nearby_mine_counts(),
+                            squareStates=board.get_state_codes(),
+                            revealedSafeCount=engine.revealed_safe_count,
+                            correctFlagCount=engine.correct_flag_count,
+                            wrongFlagCount=engine.wrong_flag_count,
+                            exploded=engine.exploded))
+    return game
+
+
+class BoardTest(SimpleTestCase):
+    def test_pack_bits_round_trip(self):
+        rng = random.Random(1)
+
+        for size in [0, 1, 7, 8, 9, 64, 1001]:
+            flags = bytes(rng.randint(0, 1) for _ in range(size))
+            bitset = pack_bits(flags)
+
+            self.assertEqual(len(bitset), (size + 7) // 8)
+            self.assertEqual(unpack_bits(bitset, size), flags)
+
+    def test_pack_bits_is_least_significant_bit_first(self):
+        self.assertEqual(pack_bits(b'\x01\x00\x00\x00\x00\x00\x00\x01\x00\x01'), b'\x81\x02')
+
+    def test_compute_nearby_mine_counts(self):
+        rng = random.Random(2)
+
+        for width, height in [(1, 1), (1, 9), (9, 1), (2, 2), (9, 9), (30, 16), (17, 31)]:
+            for mine_density in [0, 15, 50, 100]:
+                mine_flags = place_mines(width, height, compute_mine_count(width, height, mine_density),
+                                         seed=rng.random())
+
+                self.assertEqual(list(compute_nearby_mine_counts(width, height, mine_flags)),
+                                 _count_nearby_mines(width, height, mine_flags),
+                                 f'{width}x{height} at {mine_density}%')
+
+    def test_compute_nearby_mine_counts_of_empty_board(self):
+        self.assertEqual(compute_nearby_mine_counts(0, 5, b''), b'')
+
+    def test_assemble_keeps_the_state_codes(self):
+        board = _make_board(4, 3, [(1, 1)])
+        board.set_state(0, FLAGGED)
+        board.set_state(5, EXPLODED)
+
+        assembled_board = Board.assemble(4, 3, bytes(1 if board.is_mine(index) else 0 for index in range(12)),
+                                         board.get_nearby_mine_counts(), board.get_state_codes())
+
+        self.assertEqual(assembled_board.cells, board.cells)
+        self.assertEqual(list(assembled_board.iterate_touched_squares()), [(0, FLAGGED), (5, EXPLODED)])
+
+    def test_nearby_mine_count_matrix_of_zero_width_board(self):
+        self.assertEqual(Board(0, 3).get_nearby_mine_count_matrix(), [[], [], []])
+
+
+class MinePlacementTest(SimpleTestCase):
+    def test_place_the_exact_number_of_mines(self):
+        for mine_density in [0, 5, 50, 51, 90, 100]:
+            mine_count = compute_mine_count(30, 16, mine_density)
+            mine_flags = place_mines(30, 16, mine_count, seed=mine_density)
+
+            self.assertEqual(len(mine_flags), 30 * 16)
+            self.assertEqual(sum(mine_flags), mine_count)
+            self.assertLessEqual(set(mine_flags), {0, 1})
+
+    def test_placement_is_reproducible_with_the_same_seed(self):
+        self.assertEqual(place_mines(50, 50, 400, seed=7), place_mines(50, 50, 400, seed=7))
+        self.assertNotEqual(place_mines(50, 50, 400, seed=7), place_mines(50, 50, 400, seed=8))
+
+    def test_mine_count_is_bounded_by_the_board_size(self):
+        self.assertEqual(sum(place_mines(3, 3, 20, seed=1)), 9)
+        self.assertEqual(sum(place_mines(3, 3, -1, seed=1)), 0)
+
+
+class RevealEngineTest(SimpleTestCase):
+    def test_flood_stops_at_the_numbered_squares(self):
+        board = _make_board(5, 5, [(4, 4)])
+
+        self.assertEqual(reveal_area(board, board.index(0, 0)), [index for index in range(25) if index != 24])
+
+    def test_reveal_numbered_square_only(self):
+        board = _make_board(5, 5, [(4, 4)])
+
+        self.assertEqual(reveal_area(board, board.index(3, 3)), [board.index(3, 3)])
+
+    def test_never_reveal_mines_or_settled_squares(self):
+        board = _make_board(5, 5, [(4, 4)])
+
+        for y in range(5):
+            board.set_state(board.index(2, y), FLAGGED)
+
+        self.assertEqual(reveal_area(board, board.index(4, 4)), [])
+        self.assertEqual(reveal_area(board, board.index(2, 0)), [])
+        self.assertEqual(reveal_area(board, board.index(0, 0)),
+                         [board.index(x, y) for y in range(5) for x in range(2)])
+
+    def test_same_area_as_breadth_first_search(self):
+        rng = random.Random(3)
+
+        for width, height in [(1, 1), (1, 7), (7, 1), (9, 9), (16, 30), (64, 3)]:
+            for mine_density in [0, 5, 15, 30]:
+                board = _make_random_board(width, height, mine_density, rng.randint(0, 1000))
+
+                for index in rng.sample(range(board.size), board.size // 10):
+                    board.set_state(index, rng.choice([FLAGGED, UNKNOWN, CLEARED]))
+
+                for origin in range(board.size):
+                    self.assertEqual(reveal_area(board, origin), sorted(_search_area(board, origin)),
+                                     f'{width}x{height} at {mine_density}% from {origin}')
+
+    def test_winding_area_falls_back_to_breadth_first_search(self):
+        # A zigzag corridor walled by flags is much longer than the board is wide or high.
+        board = Board(41, 41)
+
+        for y in range(0, 41, 4):
+            for x in range(0, 39):
+                board.set_state(board.index(x, y), FLAGGED)
+
+        for y in range(2, 41, 4):
+            for x in range(2, 41):
+                board.set_state(board.index(x, y), FLAGGED)
+
+        origin = board.index(40, 1)
+        revealed_indexes = reveal_area(board, origin)
+
+        self.assertEqual(revealed_indexes, sorted(_search_area(board, origin)))
+        self.assertEqual(len(revealed_indexes), 41 * 41 - 11 * 39 - 10 * 39)
+
+    def test_chord_targets(self):
+        board = _make_board(3, 3, [(0, 0)])
+        center = board.index(1, 1)
+
+        self.assertEqual(get_chord_targets(board, center), [])  # Not cleared yet
+
+        board.set_state(center, CLEARED)
+        self.assertEqual(get_chord_targets(board, center), [])  # Not flagged yet
+
+        board.set_state(board.index(0, 0), FLAGGED)
+        self.assertEqual(get_chord_targets(board, center), [1, 2, 3, 5, 6, 7, 8])
+
+
+class BoardEngineTest(SimpleTestCase):
+    def test_reveal_then_flag_the_last_mine_to_clear(self):
+        engine = BoardEngine(_make_board(5, 5, [(4, 4)]))
+
+        moves = engine.apply(0, None)
+
+        self.assertEqual(len(moves), 24)
+        self.assertTrue(all(state == CLEARED for _, state in moves))
+        self.assertEqual(engine.revealed_safe_count, 24)
+        self.assertEqual(engine.changed_indexes, {index for index, _ in moves})
+        self.assertEqual(engine.evaluate(), ACTIVE)
+
+        self.assertEqual(engine.apply(24, FLAGGED), [(24, FLAGGED)])
+        self.assertEqual(engine.correct_flag_count, 1)
+        self.assertEqual(engine.evaluate(), CLEARED)
+
+    def test_flag_counters(self):
+        engine = BoardEngine(_make_board(3, 3, [(0, 0)]))
+
+        engine.apply(0, FLAGGED)
+        engine.apply(1, FLAGGED)
+        self.assertEqual((engine.correct_flag_count, engine.wrong_flag_count), (1, 1))
+
+        engine.apply(1, UNKNOWN)
+        self.assertEqual((engine.correct_flag_count, engine.wrong_flag_count), (1, 0))
+
+        engine.apply(0, UNKNOWN)
+        self.assertEqual((engine.correct_flag_count, engine.wrong_flag_count), (0, 0))
+
+    def test_wrong_flags_count_as_cleared(self):
+        engine = BoardEngine(_make_board(2, 1, [(0, 0)]))
+
+        engine.apply(0, FLAGGED)
+        engine.apply(1, FLAGGED)
+
+        self.assertEqual(engine.evaluate(), CLEARED)
+
+    def test_reveal_mine_explodes(self):
+        engine = BoardEngine(_make_board(3, 3, [(0, 0)]))
+
+        self.assertEqual(engine.apply(0, None), [(0, EXPLODED)])
+        self.assertTrue(engine.exploded)
+        self.assertEqual(engine.evaluate(), EXPLODED)
+
+    def test_chord_reveals_the_unflagged_neighbours(self):
+        engine = BoardEngine(_make_board(3, 1, [(0, 0)]))
+
+        engine.apply(1, None)
+        engine.apply(0, FLAGGED)
+
+        self.assertEqual(engine.apply(1, CHORD), [(2, CLEARED)])
+        self.assertEqual(engine.evaluate(), CLEARED)
+
+    def test_chord_with_wrong_flag_explodes(self):
+        engine = BoardEngine(_make_board(3, 1, [(0, 0)]))
+
+        engine.apply(1, None)
+        engine.apply(2, FLAGGED)
+
+        self.assertEqual(engine.apply(1, CHORD), [(0, EXPLODED)])
+        self.assertEqual(engine.evaluate(), EXPLODED)
+
+
+class SnapshotTest(SimpleTestCase):
+    def _make_played_games(self) -> List[Game]:
+        rng = random.Random(4)
+        games: List[Game] = []
+
+        for width, height, mine_density in [(1, 1, 0), (9, 9, 15), (30, 16, 50), (7, 3, 90), (100, 80, 10)]:
+            board = _make_random_board(width, height, mine_density, rng.randint(0, 1000))
+            engine = BoardEngine(board)
+
+            for index in rng.sample(range(board.size), min(board.size, 20)):
+                engine.apply(index, rng.choice([None, FLAGGED, UNKNOWN]))
+
+            games.append(_make_game(board, engine))
+
+        games.append(_make_game(Board(0, 3), BoardEngine(Board(0, 3))))
+
+        return games
+
+    def test_json_snapshot_is_the_same_as_the_model(self):
+        for game in self._make_played_games():
+            self.assertEqual(game.get_snapshot_json(),
+                             JsonResponse(game.get_snapshot().model_dump(), safe=False).content,
+                             f'{game.info.width}x{game.info.height}')
+
+    def test_packed_snapshot_round_trip(self):
+        for game in self._make_played_games():
+            expected_snapshot = game.get_snapshot().model_dump()
+
+            for run_length_encoded in [False, True]:
+                data = snapshot_codec.encode_packed_snapshot(GameInfo.make(game.info).model_dump(),
+                                                             game.board,
+                                                             run_length_encoded)
+
+                self.assertEqual(snapshot_codec.decode_packed_snapshot(data), expected_snapshot)
+
+    def test_run_length_encoding_round_trip(self):
+        for data in [b'', b'\x00', b'\x01' * 600 + b'\x02\x02\x03', bytes(range(256))]:
+            self.assertEqual(snapshot_codec.run_length_decode(snapshot_codec.run_length_encode(data)), data)
+
+
+class GameApiTestCase(TransactionTestCase):
+    """ The API tests, with the engine thread pool using its own database connections """
+
+    def setUp(self):
+        game_engine._game_cache.clear()
+        game_engine._packed_snapshot_cache.clear()
+
+        user = User.objects.create(username='player')
+        access_token = container.get(TokenService).generate_tokens(user)['access_token']
+
+        self.user_id = user.id
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {access_token}')
+
+    def create_game(self, width: int = 9, height: int = 9, mine_density: int = 0) -> str:
+        response = self.post('/api/games/', dict(width=width, height=height, mineDensity=mine_density))
+        self.assertEqual(response.status_code, 200)
+        return response.json()['id']
+
+    def post(self, path: str, body: Any):
+        return self.client.post(path, json.dumps(body), content_type='application/json')
+
+    def put(self, path: str, body: Dict[str, Any]):
+        return self.client.put(path, json.dumps(body), content_type='application/json')
+
+    def bump_version(self, session_id: str):
+        """ Simulate a commit of another worker """
+        GameSession.objects.filter(id=session_id).update(version=F('version') + 1)
+
+
+class VisitConflictTest(GameApiTestCase):
+    def test_retry_on_the_latest_game(self):
+        session_id = self.create_game()
+        self.assertEqual(self.client.get(f'/api/rpc/snapshot/{session_id}').status_code, 200)  # Cache the game
+
+        self.bump_version(session_id)
+
+        response = self.post(f'/api/rpc/visit/{session_id}?delta=1', dict(x=0, y=0))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['base_version'], 1)
+        self.assertEqual(response.json()['info']['version'], 2)
+        self.assertEqual(GameSession.objects.get(id=session_id).revealedSafeCount, 81)
+
+    def test_conflict_after_all_attempts(self):
+        session_id = self.create_game()
+
+        with patch.object(game_engine.UnitOfWork, 'commit', side_effect=StaleGameError(session_id)):
+            response = self.post(f'/api/rpc/visit/{session_id}', dict(x=0, y=0))
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['error'], 'conflict/concurrent_update')
+
+        session = GameSession.objects.get(id=session_id)
+        self.assertEqual((session.version, session.revealedSafeCount), (0, 0))
+        self.assertFalse(GameMove.objects.filter(gameId=session_id).exists())
+
+        # The next snapshot is the one in the database, not the board of the failed visit.
+        snapshot = self.client.get(f'/api/rpc/snapshot/{session_id}').json()
+        self.assertEqual((snapshot['info']['version'], snapshot['moves']), (0, []))
+
+    def test_snapshot_reloads_the_instance_of_a_failed_visit(self):
+        session_id = self.create_game()
+        game = Game.reload(session_id)
+
+        self.bump_version(session_id)
+
+        with self.assertRaises(StaleGameError):
+            game.visit_all([GameMove(gameId=session_id, userId=self.user_id, x=0, y=0, state=None, createTime=0)])
+
+        # A concurrent snapshot request already holding the instance
+        response = game_engine._render_snapshot(game, ('json', False, None))
+        snapshot = json.loads(response.content)
+
+        self.assertEqual(snapshot['info']['version'], 1)
+        self.assertEqual(snapshot['moves'], [])
+        self.assertEqual(response.headers['ETag'], game_engine.make_etag(session_id, 1, 'json', False, None))
+
+
+class GameSessionUpdateTest(GameApiTestCase):
+    def test_update_makes_a_new_version(self):
+        session_id = self.create_game()
+
+        response = self.put(f'/api/games/{session_id}', dict(state='abandoned'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['state'], response.json()['version']), ('abandoned', 1))
+
+    def test_conflict_with_a_concurrent_visit(self):
+        session_id = self.create_game()
+        update_game_session = views._update_game_session
+
+        def update_after_concurrent_visit(game_session: GameSession, entry: Dict[str, Any]) -> GameSession:
+            # NOTE: The update is mapped on the event loop, where the synchronous ORM is not allowed.
+            concurrent_visit = Thread(target=self.bump_version, args=[session_id])
+            concurrent_visit.start()
+            concurrent_visit.join()
+
+            return update_game_session(game_session, entry)
+
+        with patch.object(views, '_update_game_session', update_after_concurrent_visit):
+            response = self.put(f'/api/games/{session_id}', dict(state='abandoned'))
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['error'], 'conflict/concurrent_update')
+
+        session = GameSession.objects.get(id=session_id)
+        self.assertEqual((session.state, session.version), (None, 1))
+
+
+class GameCacheTest(GameApiTestCase):
+    def test_reuse_the_cached_game_of_the_latest_version(self):
+        session_id = self.create_game()
+
+        game = async_to_sync(Game.aload)(session_id)
+
+        self.assertIs(async_to_sync(Game.aload)(session_id), game)
+
+        self.bump_version(session_id)
+        latest_game = async_to_sync(Game.aload)(session_id)
+
+        self.assertIsNot(latest_game, game)
+        self.assertEqual(latest_game.info.version, 1)
+        self.assertIs(async_to_sync(Game.aload)(session_id), latest_game)
+
+    def test_forget_the_deleted_game(self):
+        session_id = self.create_game()
+        async_to_sync(Game.aload)(session_id)
+
+        GameSession.objects.filter(id=session_id).delete()
+
+        self.assertIsNone(async_to_sync(Game.aload)(session_id))
+        self.assertEqual(self.client.get(f'/api/rpc/snapshot/{session_id}').status_code, 404)
+
+
+class SnapshotRevalidationTest(GameApiTestCase):
+    def test_not_modified_until_the_board_changes(self):
+        session_id = self.create_game()
+
+        for path in [f'/api/rpc/snapshot/{session_id}', f'/api/rpc/snapshot/{session_id}?format=packed']:
+            etag = self.client.get(path).headers['ETag']
+
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual((response.status_code, response.headers['ETag']), (304, etag))
+
+        json_etag = self.client.get(f'/api/rpc/snapshot/{session_id}').headers['ETag']
+        self.post(f'/api/rpc/visit/{session_id}', dict(x=0, y=0))
+
+        response = self.client.get(f'/api/rpc/snapshot/{session_id}', HTTP_IF_NONE_MATCH=json_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], json_etag)
+
+    def test_keep_only_the_latest_packed_snapshot(self):
+        session_id = self.create_game()
+        path = f'/api/rpc/snapshot/{session_id}?format=packed'
+
+        previous_body = self.client.get(path).content
+        self.post(f'/api/rpc/visit/{session_id}', dict(x=0, y=0))
+        body = self.client.get(path).content
+
+        self.assertNotEqual(body, previous_body)
+        self.assertEqual(snapshot_codec.decode_packed_snapshot(body)['info']['version'], 1)
+        self.assertEqual(len(game_engine._packed_snapshot_cache), 1)
+
+    def test_listing_not_modified_until_a_session_is_added(self):
+        self.create_game()
+        etag = self.client.get('/api/games/').headers['ETag']
+
+        self.assertEqual(self.client.get('/api/games/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.create_game()
+        self.assertEqual(self.client.get('/api/games/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_listing_modified_after_replacing_a_session(self):
+        deleted_session_id = self.create_game()
+        session_id = self.create_game()
+        etag = self.client.get('/api/games/').headers['ETag']
+
+        # The same count, versions and latest creation time as before
+        GameSession.objects.filter(id=deleted_session_id).delete()
+        GameSession.objects.filter(id=self.create_game()).update(
+            createTime=GameSession.objects.get(id=session_id).createTime,
+        )
+
+        self.assertEqual(self.client.get('/api/games/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_listing_page_not_modified_by_the_other_pages(self):
+        for _ in range(3):
+            self.create_game()
+
+        path = '/api/games/?page_size=2'
+        first_page = self.client.get(path)
+        second_page_path = first_page.headers['Link'][1:first_page.headers['Link'].index('>')]
+        etag = self.client.get(second_page_path).headers['ETag']
+
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=first_page.headers['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(second_page_path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class GameSessionListingTest(GameApiTestCase):
+    def test_follow_the_cursor_to_the_last_page(self):
+        expected_ids = [self.create_game(3, 3) for _ in range(25)]
+        expected_ids = list(GameSession.objects.filter(id__in=expected_ids)
+                            .order_by('-createTime', '-id')
+                            .values_list('id', flat=True))
+
+        listed_ids: List[str] = []
+        page_sizes: List[int] = []
+        path = '/api/games/'
+
+        while path:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+
+            page = response.json()
+            listed_ids.extend(session['id'] for session in page)
+            page_sizes.append(len(page))
+            self.assertTrue(all(session['mineCoordinates'] == [] for session in page))
+
+            link = response.headers.get('Link')
+            path = link[1:link.index('>')] if link else None
+
+        self.assertEqual(page_sizes, [10, 10, 5])
+        self.assertEqual(listed_ids, expected_ids)
+
+    def test_page_size(self):
+        for _ in range(3):
+            self.create_game(3, 3)
+
+        response = self.client.get('/api/games/?page_size=2')
+        self.assertEqual(len(response.json()), 2)
+        self.assertIn('X-Next-Cursor', response.headers)
+
+        response = self.client.get('/api/games/?page_size=3')
+        self.assertEqual(len(response.json()), 3)
+        self.assertNotIn('X-Next-Cursor', response.headers)
+
+    def test_invalid_parameters(self):
+        response = self.client.get('/api/games/?page_size=many')
+        self.assertEqual((response.status_code, response.json()['error']), (400, 'invalid_request/page_size'))
+
+        response = self.client.get('/api/games/?cursor=zzz')
+        self.assertEqual((response.status_code, response.json()['error']), (400, 'invalid_request/cursor'))
+
+
+class BatchValidationTest(GameApiTestCase):
+    def test_reject_the_whole_batch_with_an_invalid_move(self):
+        session_id = self.create_game()
+
+        for moves, index in [([1], 0),
+                             ([dict(y=0)], 0),
+                             ([dict(x=0, y=0), dict(x='1', y=0)], 1),
+                             ([dict(x=True, y=0)], 0),
+                             ([dict(x=0, y=0), dict(x=1, y=1, state=[1])], 1)]:
+            response = self.post(f'/api/rpc/batch/{session_id}', dict(moves=moves))
+
+            self.assertEqual(response.status_code, 400, moves)
+            self.assertEqual(response.json(), dict(error='invalid_request/move', index=index))
+
+        for body in [[dict(x=0, y=0)], dict(moves=[]), 'moves']:
+            response = self.post(f'/api/rpc/batch/{session_id}', body)
+            self.assertEqual((response.status_code, response.json()['error']), (400, 'invalid_request/moves'))
+
+        response = self.post(f'/api/rpc/batch/{session_id}', dict(moves=[dict(x=0, y=0), dict(x=9, y=0)]))
+        self.assertEqual((response.status_code, response.json()['error']), (400, 'invalid_request/out_of_bounds'))
+
+        self.assertEqual(GameSession.objects.get(id=session_id).version, 0)
+        self.assertFalse(GameMove.objects.filter(gameId=session_id).exists())
+
+    def test_apply_the_valid_batch(self):
+        session_id = self.create_game()
+
+        response = self.post(f'/api/rpc/batch/{session_id}?delta=1',
+                             dict(moves=[dict(x=8, y=8, state='flagged'), dict(x=0, y=0)]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['info']['version'], 1)
+        self.assertEqual(len(response.json()['changes']), 81)
+
+
+class StreamingTest(GameApiTestCase):
+    def test_refuse_streaming_under_wsgi(self):
+        session_id = self.create_game()
+
+        for path in [f'/api/rpc/events/{session_id}', '/api/moves/?stream=ndjson']:
+            response = self.client.get(path)
+            self.assertEqual((response.status_code, response.json()['error']), (501, 'not_supported/streaming'))
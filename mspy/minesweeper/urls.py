@@ -10,6 +10,10 @@ urlpatterns = [
     path("games/<str:id>", views.game_session_individual),
     path("moves/", views.game_move_root),
     path("ping", views.api_ping),
+    path("metrics", views.api_metrics),
     path("rpc/snapshot/<str:session_id>", game_engine.get_snapshot),
     path("rpc/visit/<str:session_id>", game_engine.visit),
+    path("rpc/batch/<str:session_id>", game_engine.visit_batch),
+    path("rpc/events/<str:session_id>", game_engine.subscribe_events),
+    path("rpc/events/<str:session_id>/token", game_engine.issue_event_token),
 ]
@@ -1,15 +1,19 @@
 import math
-import random
+from itertools import compress
 from time import time
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List
 from uuid import uuid4
 
 from django.contrib.auth import authenticate
-from django.http import JsonResponse, HttpRequest
+from django.forms import model_to_dict
+from django.http import JsonResponse, HttpRequest, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from imagination import container
 from jwt import ExpiredSignatureError
 
+from minesweeper.common.board import compute_nearby_mine_counts, pack_bits, unpack_bits
+from minesweeper.common.instrumentation import is_metrics_access_allowed, metric_registry
+from minesweeper.common.mine_placement import compute_mine_count, place_mines
 from minesweeper.common.rest_api_utils import respond_error, handle_root_api_request, get_authorized_user_id, \
     handle_api_request_for_one_resource
 from minesweeper.common.token_service import TokenService
@@ -25,6 +29,14 @@ def api_ping(request):
     return JsonResponse({'ping': 'pong'})
 
 
+def api_metrics(request):
+    """ The request metrics of this worker process in the Prometheus text format """
+    if not is_metrics_access_allowed(request):
+        return respond_error(401)
+
+    return HttpResponse(metric_registry.render(), content_type='text/plain; version=0.0.4')
+
+
 def api_me(request):
     """ Check if the token is still valid. """
     bearer_token = request.headers.get('authorization')
@@ -79,52 +91,75 @@ def api_oauth_refresh_tokens(request):
 ##### REST: Session #####
 
 
+def _get_board_length(entry: Dict[str, Any], field_name: str) -> int:
+    value = entry[field_name]
+
+    if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+        raise ValueError(field_name)
+
+    return value
+
+
 def _create_new_session(entry: Dict[str, Any], user_id: int) -> GameSession:
     new_session = GameSession(
         id=str(uuid4()),
         userId=user_id,
         state=None,
         createTime=math.floor(time()),
-        width=entry['width'],
-        height=entry['height'],
+        width=_get_board_length(entry, 'width'),
+        height=_get_board_length(entry, 'height'),
         mineDensity=entry['mineDensity'],
-        mineCoordinates=[],
+        mineBitset=None,
     )
 
-    expected_mine_count: int = math.ceil(new_session.width * new_session.height * new_session.mineDensity / 100)
-    coordinate_map: Dict[Tuple[int, int], Dict[str, int]] = dict()
+    expected_mine_count: int = compute_mine_count(new_session.width, new_session.height, new_session.mineDensity)
+    mine_flags = place_mines(new_session.width, new_session.height, expected_mine_count)
 
-    while len(coordinate_map) < expected_mine_count:
-        x = math.floor(random.randint(0, new_session.width - 1))
-        y = math.floor(random.randint(0, new_session.height - 1))
-        coordinate = (x, y)
-        if coordinate in coordinate_map:
-            continue
-        else:
-            coordinate_map[coordinate] = dict(x=x, y=y)
-    # end: while
+    new_session.mineBitset = pack_bits(mine_flags)
 
-    new_session.mineCoordinates = [c for c in coordinate_map.values()]
+    # The mines never move, so the hints are only computed once.
+    new_session.nearbyMineCounts = compute_nearby_mine_counts(new_session.width, new_session.height, mine_flags)
+    new_session.squareStates = bytes(len(mine_flags))
 
     return new_session
 
 
 def _mask_fields(original_list: List[GameSession]) -> List[GameSession]:
     for session in original_list:
-        session.mineCoordinates = []  # Mask the coordinate
+        session.mineBitset = None  # Mask the coordinate
     return original_list
 
 
+def _serialize_game_session(session: GameSession) -> Dict[str, Any]:
+    """ Serialize the game session with the mine coordinates as an array of {x: int, y: int} (empty if masked) """
+    data = model_to_dict(session)
+
+    if session.mineBitset is None:
+        data['mineCoordinates'] = []
+    else:
+        mine_flags = unpack_bits(bytes(session.mineBitset), session.width * session.height)
+        data['mineCoordinates'] = [
+            dict(x=index % session.width, y=index // session.width)
+            for index in compress(range(len(mine_flags)), mine_flags)
+        ]
+
+    return data
+
+
 @csrf_exempt
-def game_session_root(request: HttpRequest):
+async def game_session_root(request: HttpRequest):
     """ Root-level Game Session API """
-    return handle_root_api_request(
+    return await handle_root_api_request(
         request,
         GameSession,
         map_dict_to_object=lambda entry: _create_new_session(entry, get_authorized_user_id(request, 'game')),
         sorting_order=['-createTime'],
         reiterate_list=_mask_fields,
         listing_limit=10,
+        serialize=_serialize_game_session,
+        tag_listing=True,
+        # Only fetch the listed columns, e.g., never the mine bitset or the board state.
+        listed_fields=['id', 'userId', 'width', 'height', 'mineDensity', 'state', 'createTime', 'version'],
     )
 
 
@@ -135,58 +170,35 @@ def _update_game_session(game_session: GameSession, entry: Dict[str, Any]) -> Ga
 
 
 @csrf_exempt
-def game_session_individual(request: HttpRequest, id: str):
+async def game_session_individual(request: HttpRequest, id: str):
     """ One-resource-level Game Session API """
-    return handle_api_request_for_one_resource(request, GameSession, id, _update_game_session)
+    return await handle_api_request_for_one_resource(request, GameSession, id, _update_game_session,
+                                                     serialize=_serialize_game_session,
+                                                     get_version=lambda game_session: game_session.version,
+                                                     version_field='version')
 
 
 ##### REST: Move #####
 
 
-def _create_new_move(entry: Dict[str, Any]) -> GameMove:
-    assert 'gameId' in entry and entry['gameId'], 'gameId'
-    assert 'userId' in entry and entry['userId'], 'userId'
-
-    return GameMove(
-        gameId=entry['gameId'],
-        userId=entry['userId'],
-        x=entry['x'],
-        y=entry['y'],
-        state=entry['state'],
-        createTime=math.floor(time()),
-    )
-
-
-def _collage_moves(original_list: List[GameMove]) -> List[GameMove]:
-    """ Re-iterate the move list and only keep the last known state of each coordinate. """
-    sequence: List[Tuple[str, str]] = list()
-    lastKnownMoves: Dict[Tuple[str, str], GameMove] = dict()
-
-    for move in original_list:
-        coordinate = (move.x, move.y)
-
-        if coordinate in lastKnownMoves:
-            continue
-        else:
-            lastKnownMoves[coordinate] = move
-            sequence.append(coordinate)
-
-    return [lastKnownMoves[coordinate] for coordinate in sequence]
-
-
 @csrf_exempt
-def game_move_root(request: HttpRequest):
-    """ Root-level Game Move API """
-    return handle_root_api_request(
+async def game_move_root(request: HttpRequest):
+    """ Root-level Game Move API
+
+        The moves are read-only, as they must be applied on the board, i.e., with the visit RPC.
+    """
+    return await handle_root_api_request(
         request,
         GameMove,
-        map_dict_to_object=_create_new_move,
+        map_dict_to_object=None,
         sorting_order=['-id'],
-        reiterate_list=_collage_moves
+        reiterate_list=None,
+        refine_query=lambda query: query.latest_per_square(),  # Only keep the last known state of each coordinate.
+        streamable=True,
     )
 
 
 @csrf_exempt
-def game_move_individual(request: HttpRequest, id: str):
+async def game_move_individual(request: HttpRequest, id: str):
     """ One-resource-level Game Move API """
-    return handle_api_request_for_one_resource(request, GameMove, id, map_dict_to_object=None)
+    return await handle_api_request_for_one_resource(request, GameMove, id, map_dict_to_object=None)